@@ -1,9 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import text
 import os
 
+from .tools.service_client import ServiceClient
+
 
 SCHEDULER_SERVICE = os.getenv("SCHEDULER_SERVICE")
+scheduler_client = ServiceClient(SCHEDULER_SERVICE)
 
 def create_app():
     app = FastAPI()
@@ -20,9 +24,22 @@ def create_app():
 
     from .apis.file_system_manager import file_system_manager
     app.include_router(file_system_manager)
+    app.add_event_handler("shutdown", scheduler_client.aclose)
 
     from . import models
     from .database import engine
     models.Base.metadata.create_all(bind=engine)
+    # create_all skips existing tables, so add indexes declared after the fact
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # Likewise for columns added to existing tables
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash VARCHAR"))
+        # Replaced by ix_flashcards_deck_next_review_nulls_first
+        conn.execute(text("DROP INDEX IF EXISTS ix_flashcards_deck_next_review"))
+
+    from .tools.folder_tree import rebuild_folder_closure
+    rebuild_folder_closure(engine)
 
     return app
\ No newline at end of file
@@ -1,19 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, constr
 from typing import Optional, List
 import uuid
 import traceback
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from sqlalchemy.orm import Session, aliased
+from datetime import datetime, timezone
+import re
 import os
 
 from ..models import Folder, FlashcardDeck, File, Note, Test
 from ..database import get_db
 from ..tools.claims_extractor import get_user_id_from_jwt
+from ..tools.folder_tree import add_folder_to_tree, delete_subtree
+from ..tools.stats_cache import folder_stats_cache, invalidate_folder_stats
 
 file_system_manager = APIRouter()
 
@@ -22,17 +23,16 @@ class CreateFolderRequest(BaseModel):
     folder_name: Optional[str] = "New folder"
 
 @file_system_manager.post("/create-folder")
-async def create_folder(request_data: CreateFolderRequest, user_id: str = Depends(get_user_id_from_jwt), db: Session = Depends(get_db)):
+async def create_folder(request_data: CreateFolderRequest, user_id: str = Depends(get_user_id_from_jwt), db: AsyncSession = Depends(get_db)):
     try:
         parent_folder_id = request_data.parent_folder_id if request_data.parent_folder_id != "home" else user_id
         # Count folders with the same name
-        same_name_folders_num = (
-            db.query(func.count(Folder.id))
-            .filter(
+        same_name_folders_num = await db.scalar(
+            select(func.count(Folder.id))
+            .where(
                 Folder.name.op("~")(f"^{request_data.folder_name}(\\s*)(\\d+)?(\\s*)$"),
                 Folder.parent_id == parent_folder_id
             )
-            .scalar()
         )
 
         # Set the name
@@ -49,9 +49,10 @@ async def create_folder(request_data: CreateFolderRequest, user_id: str = Depend
             created_at=datetime.now(timezone.utc)
         )
         db.add(new_folder)
-        db.flush()
+        await db.flush()
         new_folder_id = new_folder.id
-        db.commit()
+        await add_folder_to_tree(db, new_folder_id, parent_folder_id)
+        await db.commit()
         return JSONResponse(content={
             "folder_id": str(new_folder_id),
             "parent_folder_id": parent_folder_id,
@@ -60,51 +61,54 @@ async def create_folder(request_data: CreateFolderRequest, user_id: str = Depend
         })
     except Exception as e:
         traceback.print_exc()
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def delete_file_from_storage(filename):
+CONTENT_HASH_PATTERN = r"^[0-9a-f]{64}$" # sha256 hex digest
+
+def delete_file_from_storage(filename, content_hash=None):
     if os.path.exists("files" + "/" + filename):
         os.remove("files" + "/" + filename)
         print("File deleted successfully.")
     else:
         print("File does not exist.")
 
+    # Rows saved before the hash was validated must not reach a path either
+    if content_hash and not re.fullmatch(CONTENT_HASH_PATTERN, content_hash):
+        print("Invalid content hash:", content_hash)
+        return
+
+    # File names are hard links to their blob, so one link left means no file uses it
+    blob_path = os.path.join("files", "blobs", content_hash) if content_hash else None
+    if blob_path and os.path.exists(blob_path) and os.stat(blob_path).st_nlink == 1:
+        os.remove(blob_path)
+        # The PDF rendition is keyed on the same content hash
+        rendition_path = os.path.join("files", "renditions", content_hash + ".pdf")
+        if os.path.exists(rendition_path):
+            os.remove(rendition_path)
+
+def delete_files_from_storage(files):
+    for file_id, extension, content_hash in files:
+        try:
+            delete_file_from_storage(str(file_id) + "." + extension, content_hash)
+        except Exception:
+            traceback.print_exc()
+
 @file_system_manager.delete("/delete-folder/")
-async def delete_folder(folder_id: str, db: Session = Depends(get_db)):
+async def delete_folder(folder_id: str, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     try:
-        folder = (
-            db.query(Folder)
-            .filter_by(id=folder_id)
-            .first()
-        )
-
-        files_storage_ids = []
-        folder_cte = (
-            select(Folder.id)
-            .where(Folder.id == folder_id)
-            .cte(name="subfolders", recursive=True)
-        )
-        subfolder = aliased(Folder)
-        folder_cte = folder_cte.union_all(
-            select(subfolder.id).where(subfolder.parent_id == folder_cte.c.id)
-        )
-        files = (
-            db.query(File)
-            .where(File.folder_id.in_(folder_cte))
-            .all()
-        )
-        for file in files:
-            files_storage_ids.append(str(file.id) + "." + file.extension)
+        folder_id = uuid.UUID(folder_id)
+        parent_folder_id = await db.scalar(select(Folder.parent_id).where(Folder.id == folder_id))
 
-        # Delete the main folder
-        db.delete(folder)
-        db.commit()
+        # Subfolders go with the folder, found through the closure table
+        deleted_folder_ids, deleted_files = await delete_subtree(db, folder_id)
+        await db.commit()
+        await invalidate_folder_stats(db, parent_folder_id)
+        folder_stats_cache.invalidate([folder_id, *deleted_folder_ids])
 
-        # Delete the files
-        for file_storage_id in files_storage_ids:
-            delete_file_from_storage(file_storage_id)
+        # Unlinked after the response, so large folders do not hold up the request
+        background_tasks.add_task(delete_files_from_storage, deleted_files)
 
         return JSONResponse(content={"msg": "Folder deleted!"})
     except Exception as e:
@@ -116,12 +120,12 @@ async def delete_folder(folder_id: str, db: Session = Depends(get_db)):
 async def access_folder(
     folder_id: Optional[str] = None,
     user_id: str = Depends(get_user_id_from_jwt), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         parent_folder_name = None
         if folder_id == "home":
-            folder = db.query(Folder).filter_by(id=user_id).first()
+            folder = await db.get(Folder, uuid.UUID(user_id))
             if folder is None:
                 folder = Folder(
                     id=uuid.UUID(user_id),
@@ -129,7 +133,9 @@ async def access_folder(
                     user_id=uuid.UUID(user_id)
                 )
                 db.add(folder)
-                db.commit()
+                await db.flush()
+                await add_folder_to_tree(db, folder.id)
+                await db.commit()
                 return JSONResponse(content={
                     "content": [],
                     "parent_folder_name": "Home"
@@ -137,18 +143,17 @@ async def access_folder(
             folder_id = folder.id
             parent_folder_name = folder.name
         else:
-            folder = db.query(Folder).filter_by(id=folder_id).first()
+            folder = await db.get(Folder, uuid.UUID(folder_id))
             parent_folder_name = folder.name if folder else "Home"
 
         content = []
-        subfolder_rows = (
-            db.query(Folder)
-            .filter(
+        subfolder_rows = (await db.execute(
+            select(Folder)
+            .where(
                 Folder.parent_id == folder_id,
                 Folder.user_id == uuid.UUID(user_id)
             )
-            .all()
-        )
+        )).scalars().all()
         for row in subfolder_rows:
             content.append({
                 "id": str(row.id),
@@ -158,18 +163,17 @@ async def access_folder(
             })
 
         # Get the folder's flashcard decks
-        flashcard_decks_rows = (
-            db.query(FlashcardDeck.id, FlashcardDeck.name, FlashcardDeck.created_at)
+        flashcard_decks_rows = (await db.execute(
+            select(FlashcardDeck.id, FlashcardDeck.name, FlashcardDeck.created_at)
             .join(
                 Folder,
                 FlashcardDeck.folder_id == Folder.id
             )
-            .filter(
+            .where(
                 Folder.id == folder_id,
                 Folder.user_id == uuid.UUID(user_id)
             )
-            .all()
-        )
+        )).all()
         for row in flashcard_decks_rows:
             content.append({
                 "id": str(row[0]), 
@@ -179,18 +183,17 @@ async def access_folder(
             })
 
         # Get the folder's flashcard tests
-        test_rows = (
-            db.query(Test.id, Test.name, Test.created_at)
+        test_rows = (await db.execute(
+            select(Test.id, Test.name, Test.created_at)
             .join(
                 Folder,
                 Test.folder_id == Folder.id
             )
-            .filter(
+            .where(
                 Folder.id == folder_id,
                 Folder.user_id == uuid.UUID(user_id)
             )
-            .all()
-        )
+        )).all()
         for row in test_rows:
             content.append({
                 "id": str(row[0]), 
@@ -200,18 +203,17 @@ async def access_folder(
             })
 
         # Get the folder's files
-        file_rows = (
-            db.query(File.id, File.name, File.created_at, File.extension)
+        file_rows = (await db.execute(
+            select(File.id, File.name, File.created_at, File.extension)
             .join(
                 Folder,
                 File.folder_id == Folder.id
             )
-            .filter(
+            .where(
                 Folder.id == folder_id,
                 Folder.user_id == uuid.UUID(user_id)
             )
-            .all()
-        )
+        )).all()
         for row in file_rows:
             content.append({
                 "id": str(row[0]), 
@@ -222,11 +224,10 @@ async def access_folder(
             })
 
         # Get the folder's files
-        notes_rows = (
-            db.query(Note.id, Note.name, Note.created_at)
-            .filter(Note.folder_id == folder_id)
-            .all()
-        )
+        notes_rows = (await db.execute(
+            select(Note.id, Note.name, Note.created_at)
+            .where(Note.folder_id == folder_id)
+        )).all()
         for row in notes_rows:
             content.append({
                 "id": str(row[0]), 
@@ -247,29 +248,36 @@ class FileMetadata(BaseModel):
     file_id: str
     name: str
     extension: str
+    # Becomes part of the blob and rendition paths
+    content_hash: Optional[constr(pattern=CONTENT_HASH_PATTERN)] = None
 
 class SaveFileNamesRequest(BaseModel):
     file_metadata: List[FileMetadata]
     folder_id: Optional[str] = None
 
 @file_system_manager.post("/save-file-names")
-async def save_file_names(request_data: SaveFileNamesRequest, db: Session = Depends(get_db)):
+async def save_file_names(request_data: SaveFileNamesRequest, db: AsyncSession = Depends(get_db)):
     try:
-        folder = db.query(Folder).filter_by(id=request_data.folder_id).first()
+        folder = (await db.execute(
+            select(Folder).where(Folder.id == request_data.folder_id)
+        )).scalars().first()
         if not folder:
             folder = Folder(
                 name=request_data.file_metadata[0].name,
             )
         
         for file_meta in request_data.file_metadata:
-            folder.files.append(
+            # Set the parent from the file's side so the folder's files aren't loaded
+            db.add(
                 File(
                     id=file_meta.file_id,
                     name=file_meta.name,
-                    extension=file_meta.extension
+                    extension=file_meta.extension,
+                    content_hash=file_meta.content_hash,
+                    folder=folder
                 )
             )
-        db.commit()
+        await db.commit()
         return JSONResponse(content={"msg": "File names saved!"})
     except Exception as e:
         traceback.print_exc()
@@ -277,15 +285,15 @@ async def save_file_names(request_data: SaveFileNamesRequest, db: Session = Depe
     
 
 @file_system_manager.delete("/delete-deck/")
-async def delete_deck(deck_id: str, db: Session = Depends(get_db)):
+async def delete_deck(deck_id: str, db: AsyncSession = Depends(get_db)):
     try:
-        deck = (
-            db.query(FlashcardDeck)
-            .filter_by(id=deck_id)
-            .first()
-        )
-        db.delete(deck)
-        db.commit()
+        deck = (await db.execute(
+            select(FlashcardDeck).where(FlashcardDeck.id == deck_id)
+        )).scalars().first()
+        folder_id = deck.folder_id
+        await db.delete(deck)
+        await db.commit()
+        await invalidate_folder_stats(db, folder_id)
         return JSONResponse(content={"msg": "Deck deleted!"})
     except Exception as e:
         traceback.print_exc()
@@ -293,15 +301,15 @@ async def delete_deck(deck_id: str, db: Session = Depends(get_db)):
     
 
 @file_system_manager.delete("/delete-test/")
-async def delete_test(test_id: str, db: Session = Depends(get_db)):
+async def delete_test(test_id: str, db: AsyncSession = Depends(get_db)):
     try:
-        test = (
-            db.query(Test)
-            .filter_by(id=test_id)
-            .first()
-        )
-        db.delete(test)
-        db.commit()
+        test = (await db.execute(
+            select(Test).where(Test.id == test_id)
+        )).scalars().first()
+        folder_id = test.folder_id
+        await db.delete(test)
+        await db.commit()
+        await invalidate_folder_stats(db, folder_id)
         return JSONResponse(content={"msg": "Test deleted!"})
     except Exception as e:
         traceback.print_exc()
@@ -309,15 +317,15 @@ async def delete_test(test_id: str, db: Session = Depends(get_db)):
     
 
 @file_system_manager.delete("/delete-note/")
-async def delete_test(note_id: str, db: Session = Depends(get_db)):
+async def delete_test(note_id: str, db: AsyncSession = Depends(get_db)):
     try:
-        note = (
-            db.query(Note)
-            .filter_by(id=note_id)
-            .first()
-        )
-        db.delete(note)
-        db.commit()
+        note = (await db.execute(
+            select(Note).where(Note.id == note_id)
+        )).scalars().first()
+        folder_id = note.folder_id
+        await db.delete(note)
+        await db.commit()
+        await invalidate_folder_stats(db, folder_id)
         return JSONResponse(content={"msg": "Note deleted!"})
     except Exception as e:
         traceback.print_exc()
@@ -325,17 +333,16 @@ async def delete_test(note_id: str, db: Session = Depends(get_db)):
 
 
 @file_system_manager.delete("/delete-file/")
-async def delete_file(file_id: str, db: Session = Depends(get_db)):
+async def delete_file(file_id: str, db: AsyncSession = Depends(get_db)):
     try:
-        file = (
-            db.query(File)
-            .filter_by(id=file_id)
-            .first()
-        )
+        file = (await db.execute(
+            select(File).where(File.id == file_id)
+        )).scalars().first()
         file_storage_id = str(file.id) + "." + file.extension
-        db.delete(file)
-        db.commit()
-        delete_file_from_storage(file_storage_id)
+        content_hash = file.content_hash
+        await db.delete(file)
+        await db.commit()
+        delete_file_from_storage(file_storage_id, content_hash)
         return JSONResponse(content={"msg": "File deleted!"})
     except Exception as e:
         traceback.print_exc()
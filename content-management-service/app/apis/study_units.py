@@ -1,13 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 import uuid
+import base64
 import traceback
-from sqlalchemy.orm import Session, aliased
-from sqlalchemy import select, func, or_, exists, case
-import requests
-from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, func, or_, and_, exists, case, true
+from datetime import datetime, timezone, timedelta, time
 import random
 
 from ..models import (
@@ -16,8 +16,10 @@ from ..models import (
     TestItemReview, TestSession
 )
 from ..database import get_db
-from .. import SCHEDULER_SERVICE
-from ..tools.claims_extractor import get_user_id_from_jwt
+from .. import scheduler_client
+from ..tools.claims_extractor import get_user_id_from_jwt, verify_service_token
+from ..tools.folder_tree import get_subtree_ids
+from ..tools.stats_cache import folder_stats_cache, invalidate_folder_stats
 
 study_units = APIRouter()
 
@@ -28,34 +30,31 @@ class FlashcardRequest(BaseModel):
     flashcards: dict
 
 @study_units.post("/save-flashcards")
-async def save_flashcards(request_data: FlashcardRequest, db: Session = Depends(get_db)):
+async def save_flashcards(request_data: FlashcardRequest, db: AsyncSession = Depends(get_db)):
     try:
-        # Convert user_id and folder_id to UUIDs
-        flashcard_deck_name = request_data.deck_name
-
-        # Create or get folder
-        folder = db.query(Folder).filter_by(id=request_data.folder_id).first()
+        folder_id = uuid.UUID(request_data.folder_id)
 
         # Create flashcard deck
-        flashcard_deck = FlashcardDeck(
-            folder_id=folder.id,
-            name=flashcard_deck_name,
-        )
-        db.add(flashcard_deck)
-        db.flush()
-        flashcard_deck_id = flashcard_deck.id
-
-        # Save flashcards
-        for flashcard_type, flashcards in request_data.flashcards.items():
-            cleaned_type = flashcard_type.replace("_flashcards", "")
-            for flashcard in flashcards:
-                flashcard_deck.flashcards.append(
-                    Flashcard(
-                        type=cleaned_type,
-                        content=flashcard
-                    )
-                )
-        db.commit()
+        flashcard_deck_id = await db.scalar(
+            insert(FlashcardDeck)
+            .values(folder_id=folder_id, name=request_data.deck_name)
+            .returning(FlashcardDeck.id)
+        )
+
+        # Save flashcards, sent as one multi-row INSERT instead of one per card
+        flashcards = [
+            {
+                "deck_id": flashcard_deck_id,
+                "type": flashcard_type.replace("_flashcards", ""),
+                "content": flashcard
+            }
+            for flashcard_type, type_flashcards in request_data.flashcards.items()
+            for flashcard in type_flashcards
+        ]
+        if flashcards:
+            await db.execute(insert(Flashcard), flashcards)
+        await db.commit()
+        await invalidate_folder_stats(db, folder_id)
 
         return JSONResponse(content={"flashcard_deck_id": str(flashcard_deck_id)})
     except Exception as e:
@@ -69,7 +68,7 @@ class SaveNoteRequest(BaseModel):
     folder_id: Optional[str] = None
 
 @study_units.post("/save-note")
-async def save_note(request_data: SaveNoteRequest, db: Session = Depends(get_db)):
+async def save_note(request_data: SaveNoteRequest, db: AsyncSession = Depends(get_db)):
     try:
         new_note = Note(
             folder_id=request_data.folder_id,
@@ -78,9 +77,10 @@ async def save_note(request_data: SaveNoteRequest, db: Session = Depends(get_db)
             type="general"
         )
         db.add(new_note)
-        db.flush()
+        await db.flush()
         new_note_id = new_note.id
-        db.commit()
+        await db.commit()
+        await invalidate_folder_stats(db, request_data.folder_id)
         return JSONResponse(content={"note_id": str(new_note_id)})
     except Exception as e:
         traceback.print_exc()
@@ -93,23 +93,21 @@ class SaveTestRequest(BaseModel):
     test_items: list[dict]
 
 @study_units.post("/save-test")
-async def save_note(request_data: SaveTestRequest, db: Session = Depends(get_db)):
+async def save_note(request_data: SaveTestRequest, db: AsyncSession = Depends(get_db)):
     try:
-        new_test = Test(
-            folder_id=request_data.folder_id,
-            name=request_data.test_name
-        )
-        db.add(new_test)
-        db.flush()
-        new_test_id = new_test.id
-        for test_item in request_data.test_items:
-            new_test.test_items.append(
-                TestItem(
-                    content=test_item,
-                    type="mult_choice",
-                )
-            )
-        db.commit()
+        new_test_id = await db.scalar(
+            insert(Test)
+            .values(folder_id=request_data.folder_id, name=request_data.test_name)
+            .returning(Test.id)
+        )
+        test_items = [
+            {"test_id": new_test_id, "content": test_item, "type": "mult_choice"}
+            for test_item in request_data.test_items
+        ]
+        if test_items:
+            await db.execute(insert(TestItem), test_items)
+        await db.commit()
+        await invalidate_folder_stats(db, request_data.folder_id)
         return JSONResponse(content={"test_id": str(new_test_id)})
     except Exception as e:
         traceback.print_exc()
@@ -120,7 +118,37 @@ async def save_note(request_data: SaveTestRequest, db: Session = Depends(get_db)
 def date_to_str(dateobj):
     return dateobj.strftime("%Y-%m-%d %H:%M:%S")
 
-def flashcard_results(flashcards):
+def to_utc(dateobj):
+    if dateobj.tzinfo is None:
+        return dateobj.replace(tzinfo=timezone.utc)
+    return dateobj.astimezone(timezone.utc)
+
+def get_review_cutoff():
+    # Cards due at any time today are due, compared on the raw column so the index is used
+    return datetime.combine(datetime.now(timezone.utc).date() + timedelta(days=1), time.min)
+
+async def get_cards_ratings_times(flashcards, user_id):
+    # The answer buttons' intervals are a nice-to-have, so the page is served without them on failure
+    if not flashcards:
+        return []
+    try:
+        # Only computes the times, so it is safe to retry like a read
+        response = await scheduler_client.post(
+            "/ratings-times-batch",
+            idempotent=True,
+            json={
+                "user_id": user_id,
+                "cards": [flashcard.fsrs_card for flashcard in flashcards]
+            }
+        )
+        response.raise_for_status()
+        return response.json().get("ratings_times")
+    except Exception:
+        traceback.print_exc()
+        return [None] * len(flashcards)
+
+async def flashcard_results(flashcards, user_id):
+    ratings_times = await get_cards_ratings_times(flashcards, user_id)
     return [
         {
             "id": flashcard.id,
@@ -128,8 +156,9 @@ def flashcard_results(flashcards):
             "next_review": date_to_str(flashcard.next_review) if flashcard.next_review else None,
             "content": flashcard.content,
             "created_at": date_to_str(flashcard.created_at),
-            "fsrs_card": flashcard.fsrs_card
-        } for flashcard in flashcards
+            "fsrs_card": flashcard.fsrs_card,
+            "ratings_times": flashcard_ratings_times
+        } for flashcard, flashcard_ratings_times in zip(flashcards, ratings_times)
     ]
 
 @study_units.get("/flashcards")
@@ -137,7 +166,7 @@ async def get_flashcards(
     flashcard_deck_id: Optional[str] = None, 
     folder_id: Optional[str] = None, 
     user_id: str = Depends(get_user_id_from_jwt), 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     per_page: Optional[int] = 10
 ):
     try:
@@ -146,78 +175,63 @@ async def get_flashcards(
         # Get the flashcards from a specific deck
         flashcards = []
         if flashcard_deck_id:
-            total_flashcards = ( # bug
-                db.query(func.count(Flashcard.id))
-                .filter(
+            total_flashcards = await db.scalar( # bug
+                select(func.count(Flashcard.id))
+                .where(
                     Flashcard.deck_id == uuid.UUID(flashcard_deck_id),
                     or_(
-                        func.date(Flashcard.next_review) <= datetime.now(timezone.utc).date(),
+                        Flashcard.next_review < get_review_cutoff(),
                         Flashcard.next_review.is_(None)
                     )
                 )
-                .scalar()
             )
-            flashcards = (
-                db.query(Flashcard)
-                .filter(
+            flashcards = (await db.execute(
+                select(Flashcard)
+                .where(
                     Flashcard.deck_id == uuid.UUID(flashcard_deck_id),
                     or_(
-                        func.date(Flashcard.next_review) <= datetime.now(timezone.utc).date(),
+                        Flashcard.next_review < get_review_cutoff(),
                         Flashcard.next_review.is_(None)
                     )
                 )
                 .order_by(Flashcard.next_review.asc().nullsfirst())
                 .limit(per_page)
-                .all()
-            )
+            )).scalars().all()
             return JSONResponse(content={
-                "flashcards": flashcard_results(flashcards),
+                "flashcards": await flashcard_results(flashcards, user_id),
                 "total_flashcards": total_flashcards
             })
 
         # Get the flashcards from a folder and its subfolders
-        folder_cte = (
-            select(Folder.id)
-            .where(
-                Folder.id == folder_id,
-                Folder.user_id == user_id
-            )
-            .cte(name="subfolders", recursive=True)
-        )
-        subfolder = aliased(Folder)
-        folder_cte = folder_cte.union_all(
-            select(subfolder.id).where(subfolder.parent_id == folder_cte.c.id)
-        )
+        subtree_ids = get_subtree_ids(folder_id, user_id)
         deck_ids_subquery = (
             select(FlashcardDeck.id)
-            .where(FlashcardDeck.folder_id.in_(folder_cte))
+            .where(FlashcardDeck.folder_id.in_(subtree_ids))
         )
-        total_flashcards = (
-            db.query(func.count(Flashcard.id))
-            .filter(
+        total_flashcards = await db.scalar(
+            select(func.count(Flashcard.id))
+            .where(
                 Flashcard.deck_id.in_(deck_ids_subquery),
                 or_(
-                    func.date(Flashcard.next_review) <= datetime.now(timezone.utc).date(),
+                    Flashcard.next_review < get_review_cutoff(),
                     Flashcard.next_review.is_(None)
                 )
             )
-            .scalar()
         )
-        flashcards = (
-            db.query(Flashcard)
-            .filter(
+        flashcards = (await db.execute(
+            select(Flashcard)
+            .where(
                 Flashcard.deck_id.in_(deck_ids_subquery),
                 or_(
-                    func.date(Flashcard.next_review) <= datetime.now(timezone.utc).date(),
+                    Flashcard.next_review < get_review_cutoff(),
                     Flashcard.next_review.is_(None)
                 )
             )
             .order_by(Flashcard.next_review.asc().nullsfirst())
             .limit(per_page)
-            .all()
-        )
+        )).scalars().all()
         return JSONResponse(content={
-            "flashcards": flashcard_results(flashcards),
+            "flashcards": await flashcard_results(flashcards, user_id),
             "total_flashcards": total_flashcards
         })
     except Exception as e:
@@ -225,6 +239,86 @@ async def get_flashcards(
         raise HTTPException(status_code=500, detail=str(e))
     
 
+def encode_review_cursor(flashcard):
+    next_review = flashcard.next_review.isoformat() if flashcard.next_review else ""
+    # Encoded so clients pass it back as is instead of building their own
+    return base64.urlsafe_b64encode(f"{next_review}|{flashcard.id}".encode()).decode()
+
+def decode_review_cursor(cursor):
+    try:
+        next_review, flashcard_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return (datetime.fromisoformat(next_review) if next_review else None), int(flashcard_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@study_units.get("/review-queue")
+async def get_review_queue(
+    flashcard_deck_id: Optional[str] = None, 
+    folder_id: Optional[str] = None, 
+    cursor: Optional[str] = None,
+    per_page: int = Query(10, ge=1, le=100),
+    include_total: bool = False,
+    user_id: str = Depends(get_user_id_from_jwt), 
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        folder_id = folder_id if folder_id != "home" else user_id
+
+        if flashcard_deck_id:
+            origin_filter = Flashcard.deck_id == uuid.UUID(flashcard_deck_id)
+        else:
+            origin_filter = Flashcard.deck_id.in_(
+                select(FlashcardDeck.id)
+                .where(FlashcardDeck.folder_id.in_(get_subtree_ids(folder_id, user_id)))
+            )
+        due_filter = or_(
+            Flashcard.next_review < get_review_cutoff(),
+            Flashcard.next_review.is_(None)
+        )
+
+        # Keyset pagination on (next_review, id) with unscheduled cards first
+        query = select(Flashcard).where(origin_filter, due_filter)
+        if cursor:
+            cursor_next_review, cursor_id = decode_review_cursor(cursor)
+            if cursor_next_review is None:
+                query = query.where(or_(
+                    and_(Flashcard.next_review.is_(None), Flashcard.id > cursor_id),
+                    Flashcard.next_review.isnot(None)
+                ))
+            else:
+                query = query.where(or_(
+                    Flashcard.next_review > cursor_next_review,
+                    and_(Flashcard.next_review == cursor_next_review, Flashcard.id > cursor_id)
+                ))
+        flashcards = (await db.execute(
+            query
+            .order_by(Flashcard.next_review.asc().nullsfirst(), Flashcard.id.asc())
+            .limit(per_page + 1)
+        )).scalars().all()
+        has_more = len(flashcards) > per_page
+        flashcards = flashcards[:per_page]
+
+        response_data = {
+            "flashcards": await flashcard_results(flashcards, user_id),
+            "next_cursor": encode_review_cursor(flashcards[-1]) if has_more else None
+        }
+        if include_total:
+            stats = None if flashcard_deck_id else folder_stats_cache.get(user_id, folder_id)
+            if stats is not None:
+                response_data["total_flashcards"] = stats["flashcards"]["due"] if stats["flashcards"] else 0
+            else:
+                response_data["total_flashcards"] = await db.scalar(
+                    select(func.count(Flashcard.id))
+                    .where(origin_filter, due_filter)
+                )
+        return JSONResponse(content=response_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 class ReviewFlashcardRequest(BaseModel):
     flashcard_id: int
     rating: int
@@ -232,16 +326,20 @@ class ReviewFlashcardRequest(BaseModel):
 @study_units.post("/review-flashcard")
 async def review_flashcard(
     request_data: ReviewFlashcardRequest, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: str = Depends(get_user_id_from_jwt)
 ):
     try:
         # Get card
-        card = db.query(Flashcard).filter_by(id=request_data.flashcard_id).first()
+        card, folder_id = (await db.execute(
+            select(Flashcard, FlashcardDeck.folder_id)
+            .join(FlashcardDeck, FlashcardDeck.id == Flashcard.deck_id)
+            .where(Flashcard.id == request_data.flashcard_id)
+        )).first()
 
         # Call scheduler
-        response = requests.post(
-            url=SCHEDULER_SERVICE + "/schedule-flashcard",
+        response = await scheduler_client.post(
+            "/schedule-flashcard",
             json={
                 "card": card.fsrs_card,
                 "rating": request_data.rating,
@@ -258,50 +356,201 @@ async def review_flashcard(
         card.next_review = next_review_date
 
         # Add new card review log
-        card.flashcard_reviews.append(
-            FlashcardReview(fsrs_review=response_data.get("review_log"))
+        db.add(
+            FlashcardReview(flashcard_id=card.id, fsrs_review=response_data.get("review_log"))
         )
-        db.commit()
+        await db.commit()
+        await invalidate_folder_stats(db, folder_id)
 
         return JSONResponse(content={
             "due_date": date_to_str(next_review_date),
-            "new_fsrs_card": response_data.get("new_card")
+            "new_fsrs_card": response_data.get("new_card"),
+            "ratings_times": response_data.get("ratings_times")
         })
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+
+class FlashcardReviewEntry(BaseModel):
+    flashcard_id: int
+    rating: int
+    reviewed_at: Optional[datetime] = None
+
+class ReviewFlashcardsBatchRequest(BaseModel):
+    reviews: List[FlashcardReviewEntry]
+
+@study_units.post("/review-flashcards-batch")
+async def review_flashcards_batch(
+    request_data: ReviewFlashcardsBatchRequest, 
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(get_user_id_from_jwt)
+):
+    try:
+        if not request_data.reviews:
+            return JSONResponse(content={"results": []})
+
+        # Replay the reviews in the order they happened
+        now = datetime.now(timezone.utc)
+        for review in request_data.reviews:
+            review.reviewed_at = to_utc(review.reviewed_at) if review.reviewed_at else now
+        reviews = sorted(request_data.reviews, key=lambda review: review.reviewed_at)
+
+        # Get all the cards at once, only from the user's own folders
+        card_rows = (await db.execute(
+            select(Flashcard, FlashcardDeck.folder_id)
+            .join(FlashcardDeck, FlashcardDeck.id == Flashcard.deck_id)
+            .join(Folder, Folder.id == FlashcardDeck.folder_id)
+            .where(
+                Flashcard.id.in_({review.flashcard_id for review in reviews}),
+                Folder.user_id == user_id
+            )
+        )).all()
+        cards = {card.id: card for card, _ in card_rows}
+        missing_ids = {review.flashcard_id for review in reviews} - cards.keys()
+        if missing_ids:
+            raise HTTPException(status_code=404, detail=f"Flashcards not found: {sorted(missing_ids)}")
+
+        # Call scheduler once for the whole batch
+        response = await scheduler_client.post(
+            "/schedule-flashcards",
+            json={
+                "user_id": user_id,
+                "reviews": [
+                    {
+                        "card_id": review.flashcard_id,
+                        "card": cards[review.flashcard_id].fsrs_card,
+                        "rating": review.rating,
+                        "review_datetime": review.reviewed_at.isoformat()
+                    } for review in reviews
+                ]
+            }
+        )
+        response.raise_for_status()
+        scheduled_reviews = response.json().get("results") or []
+        if len(scheduled_reviews) != len(reviews):
+            # zip would quietly drop the reviews without a result
+            await db.rollback()
+            raise HTTPException(
+                status_code=502,
+                detail=f"Scheduler returned {len(scheduled_reviews)} results for {len(reviews)} reviews"
+            )
+
+        # Save the new cards and review logs in one transaction
+        results = []
+        for review, scheduled in zip(reviews, scheduled_reviews):
+            card = cards[review.flashcard_id]
+            card.fsrs_card = scheduled.get("new_card")
+            next_review_date = datetime.fromisoformat(scheduled.get("new_card").get("due")).replace(tzinfo=None)
+            card.next_review = next_review_date
+            db.add(FlashcardReview(flashcard_id=card.id, fsrs_review=scheduled.get("review_log")))
+            results.append({
+                "flashcard_id": card.id,
+                "due_date": date_to_str(next_review_date),
+                "new_fsrs_card": scheduled.get("new_card")
+            })
+        await db.commit()
+        for folder_id in {folder_id for _, folder_id in card_rows}:
+            await invalidate_folder_stats(db, folder_id)
+
+        return JSONResponse(content={"results": results})
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@study_units.get("/review-logs-summary", dependencies=[Depends(verify_service_token)])
+async def review_logs_summary(db: AsyncSession = Depends(get_db)):
+    try:
+        rows = (await db.execute(
+            select(
+                Folder.user_id,
+                func.count(FlashcardReview.id),
+                func.max(FlashcardReview.id)
+            )
+            .join(Flashcard, Flashcard.id == FlashcardReview.flashcard_id)
+            .join(FlashcardDeck, FlashcardDeck.id == Flashcard.deck_id)
+            .join(Folder, Folder.id == FlashcardDeck.folder_id)
+            .group_by(Folder.user_id)
+        )).all()
+        return JSONResponse(content={
+            "users": [
+                {
+                    "user_id": str(user_id),
+                    "review_count": review_count,
+                    "last_review_id": last_review_id
+                } for user_id, review_count, last_review_id in rows
+            ]
+        })
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@study_units.get("/review-logs", dependencies=[Depends(verify_service_token)])
+async def get_review_logs(
+    user_id: str,
+    after_id: int = 0,
+    limit: int = 5000,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        # Keyset pagination on the review id so the logs can be streamed in chunks
+        rows = (await db.execute(
+            select(FlashcardReview.id, FlashcardReview.fsrs_review)
+            .join(Flashcard, Flashcard.id == FlashcardReview.flashcard_id)
+            .join(FlashcardDeck, FlashcardDeck.id == Flashcard.deck_id)
+            .join(Folder, Folder.id == FlashcardDeck.folder_id)
+            .where(
+                Folder.user_id == user_id,
+                FlashcardReview.id > after_id
+            )
+            .order_by(FlashcardReview.id.asc())
+            .limit(limit)
+        )).all()
+        return JSONResponse(content={
+            "review_logs": [fsrs_review for _, fsrs_review in rows],
+            "last_id": rows[-1][0] if rows else None
+        })
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @study_units.get("/note")
-async def get_note(note_id: str, db: Session = Depends(get_db), user_id: str = Depends(get_user_id_from_jwt)):
+async def get_note(note_id: str, db: AsyncSession = Depends(get_db), user_id: str = Depends(get_user_id_from_jwt)):
     try:
-        note = (
-            db.query(Note)
-            .filter(
+        note = (await db.execute(
+            select(Note)
+            .where(
                 Note.id == note_id
             )
-            .first()
-        )
+        )).scalars().first()
         if note.read == False:
             note.read = True
-            db.commit()
+            await db.commit()
+            await invalidate_folder_stats(db, note.folder_id)
         return JSONResponse(content={"content": note.content, "name": note.name})
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def get_items_test_session_answers(test_item, db, test_session):
-    test_item_review = (
-        db.query(TestItemReview)
-        .filter(
+async def get_items_test_session_answers(test_items, db, test_session):
+    if not test_items:
+        return {}
+    test_item_reviews = (await db.execute(
+        select(TestItemReview.test_item_id, TestItemReview.answers)
+        .where(
             TestItemReview.test_session == test_session,
-            TestItemReview.test_item_id == test_item.id
+            TestItemReview.test_item_id.in_([test_item.id for test_item in test_items])
         )
-        .first()
-    )
-    return test_item_review.answers if test_item_review else None
+    )).all()
+    return {test_item_id: answers for test_item_id, answers in test_item_reviews}
 
 def prepare_content(content):
     new_content = {}
@@ -330,48 +579,46 @@ async def get_test_items(
     page: int = 1,
     test_session: Optional[str] = None,
     user_id: str = Depends(get_user_id_from_jwt), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         folder_id = folder_id if folder_id != "home" else user_id
 
         # Check if this origin has any unfinished test session
         if not test_session:
-            test_session_obj = (
-                db.query(TestSession)
-                .filter(
+            test_session_obj = (await db.execute(
+                select(TestSession)
+                .where(
                     TestSession.origin_id == (test_id if test_id else folder_id),
                     TestSession.status == "ongoing"
                 )
-                .first()
-            )
+            )).scalars().first()
             if not test_session_obj:
                 new_test_session_obj = TestSession(
                     origin_id=(test_id if test_id else folder_id),
                     status="ongoing"
                 )
                 db.add(new_test_session_obj)
-                db.flush()
+                await db.flush()
                 test_session = new_test_session_obj.id
-                db.commit()
+                await db.commit()
             else:
                 test_session = test_session_obj.id
 
         test_items = []
         if test_id:
-            total_items = (
-                db.query(func.count(TestItem.id))
-                .filter(TestItem.test_id == uuid.UUID(test_id))
-                .scalar()
+            total_items = await db.scalar(
+                select(func.count(TestItem.id))
+                .where(TestItem.test_id == uuid.UUID(test_id))
             )
 
-            test_items = (
-                db.query(TestItem)
-                .filter(TestItem.test_id == uuid.UUID(test_id))
+            test_items = (await db.execute(
+                select(TestItem)
+                .where(TestItem.test_id == uuid.UUID(test_id))
                 .offset((page-1)*per_page)
                 .limit(per_page)
-                .all()
-            )
+            )).scalars().all()
+            answers = await get_items_test_session_answers(test_items, db, test_session)
             return JSONResponse(content={
                 "test_items": [
                     {
@@ -379,7 +626,7 @@ async def get_test_items(
                         "type": test_item.type,
                         "content": prepare_content(test_item.content),
                         "created_at": date_to_str(test_item.created_at),
-                        "last_answers": get_items_test_session_answers(test_item, db, test_session)
+                        "last_answers": answers.get(test_item.id)
                     } for test_item in test_items
                 ], 
                 "total_items": total_items,
@@ -388,34 +635,22 @@ async def get_test_items(
                 "per_page": per_page
             })
 
-        folder_cte = (
-            select(Folder.id)
-            .where(
-                Folder.id == folder_id,
-                Folder.user_id == user_id
-            )
-            .cte(name="subfolders", recursive=True)
-        )
-        subfolder = aliased(Folder)
-        folder_cte = folder_cte.union_all(
-            select(subfolder.id).where(subfolder.parent_id == folder_cte.c.id)
-        )
+        subtree_ids = get_subtree_ids(folder_id, user_id)
         test_ids_subquery = (
             select(Test.id)
-            .where(Test.folder_id.in_(folder_cte))
+            .where(Test.folder_id.in_(subtree_ids))
         )
-        total_items = (
-            db.query(func.count(TestItem.id))
-            .filter(TestItem.test_id.in_(test_ids_subquery))
-            .scalar()
+        total_items = await db.scalar(
+            select(func.count(TestItem.id))
+            .where(TestItem.test_id.in_(test_ids_subquery))
         )
-        test_items = (
-            db.query(TestItem)
-            .filter(TestItem.test_id.in_(test_ids_subquery))
+        test_items = (await db.execute(
+            select(TestItem)
+            .where(TestItem.test_id.in_(test_ids_subquery))
             .offset((page-1)*per_page)
             .limit(per_page)
-            .all()
-        )
+        )).scalars().all()
+        answers = await get_items_test_session_answers(test_items, db, test_session)
 
         return JSONResponse(content={
             "test_items": [
@@ -424,7 +659,7 @@ async def get_test_items(
                     "type": test_item.type,
                     "content": prepare_content(test_item.content),
                     "created_at": date_to_str(test_item.created_at),
-                    "last_answers": get_items_test_session_answers(test_item, db, test_session)
+                    "last_answers": answers.get(test_item.id)
                 } for test_item in test_items
             ], 
             "total_items": total_items,
@@ -450,18 +685,21 @@ def evaluate_accuracy(user_answers, db):
 @study_units.post("/review-test-item")
 async def review_test_item(
     req_data: ReviewTestItemRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        test_item = db.query(TestItem).filter_by(id=req_data.test_item_id).first()
-        test_item_review = (
-            db.query(TestItemReview)
-            .filter(
+        folder_id = await db.scalar(
+            select(Test.folder_id)
+            .join(TestItem, TestItem.test_id == Test.id)
+            .where(TestItem.id == req_data.test_item_id)
+        )
+        test_item_review = (await db.execute(
+            select(TestItemReview)
+            .where(
                 TestItemReview.test_item_id == req_data.test_item_id,
                 TestItemReview.test_session == req_data.test_session
             )
-            .first()
-        )
+        )).scalars().first()
         if not test_item_review:
             db.add(TestItemReview(
                 test_session=uuid.UUID(req_data.test_session),
@@ -475,7 +713,8 @@ async def review_test_item(
             test_item_review.reviewed_at = datetime.now(timezone.utc)
             test_item_review.accuracy = evaluate_accuracy(req_data.answers, db)
 
-        db.commit()
+        await db.commit()
+        await invalidate_folder_stats(db, folder_id)
         return JSONResponse(content={"msg": "Saved!"})
     except Exception as e:
         traceback.print_exc()
@@ -485,51 +724,37 @@ async def review_test_item(
 @study_units.get("/test-items-stats")
 async def test_items_stats(
     folder_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: str = Depends(get_user_id_from_jwt)
 ):
     try:
         folder_id = folder_id if folder_id != "home" else user_id
         
-        # Recursive CTE to get all subfolder IDs
-        folder_cte = (
-            select(Folder.id)
-            .where(
-                Folder.id == folder_id,
-                Folder.user_id == user_id
-            )
-            .cte(name="subfolders", recursive=True)
-        )
-        subfolder = aliased(Folder)
-        folder_cte = folder_cte.union_all(
-            select(subfolder.id)
-            .where(subfolder.parent_id == folder_cte.c.id)
-        )
+        # Closure-table lookup of the folder and all its subfolder IDs
+        subtree_ids = get_subtree_ids(folder_id, user_id)
         
-        total_items = (
-            db.query(func.count(TestItem.id))
+        total_items = await db.scalar(
+            select(func.count(TestItem.id))
             .join(Test, Test.id == TestItem.test_id)
-            .filter(Test.folder_id.in_(folder_cte))
-            .scalar()
+            .where(Test.folder_id.in_(subtree_ids))
         )
 
         avg_accuracy_subquery = (
-            db.query(
+            select(
                 TestItemReview.test_item_id.label("test_item_id"),
                 func.avg(TestItemReview.accuracy).label("avg_accuracy")
             )
             .join(TestItem, TestItem.id == TestItemReview.test_item_id)
             .join(Test, Test.id == TestItem.test_id)
-            .filter(TestItemReview.accuracy != None)
-            .filter(Test.folder_id.in_(folder_cte))
+            .where(TestItemReview.accuracy != None)
+            .where(Test.folder_id.in_(subtree_ids))
             .group_by(TestItemReview.test_item_id)
             .subquery()
         )
-        correct_items = (
-            db.query(func.count())
+        correct_items = await db.scalar(
+            select(func.count())
             .select_from(avg_accuracy_subquery)
-            .filter(avg_accuracy_subquery.c.avg_accuracy >= 0.9)
-            .scalar()
+            .where(avg_accuracy_subquery.c.avg_accuracy >= 0.9)
         )
         if total_items > 0:
             return JSONResponse(content={
@@ -545,11 +770,11 @@ async def test_items_stats(
 @study_units.get("/test-session-results")
 async def test_session_results(
     test_session: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        result = (
-            db.query(
+        result = (await db.execute(
+            select(
                 func.sum(
                     case(
                         (TestItemReview.accuracy == 1.0, 1),
@@ -557,17 +782,16 @@ async def test_session_results(
                     )
                 ).label('correct')
             )
-            .filter(
+            .where(
                 TestItemReview.accuracy != None,
                 TestItemReview.test_session == test_session
             )
-            .one()
-        )
+        )).one()
 
         # End the test session
-        test_session = db.query(TestSession).filter_by(id=test_session).first()
+        test_session = await db.get(TestSession, uuid.UUID(test_session))
         test_session.status = "done"
-        db.commit()
+        await db.commit()
         
         if result.correct:
             return JSONResponse(content={"correct": result.correct})
@@ -581,54 +805,41 @@ async def test_session_results(
 async def get_flashcards_stats(
     folder_id: Optional[str] = None, 
     user_id: str = Depends(get_user_id_from_jwt), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         folder_id = folder_id if folder_id != "home" else user_id
 
-        user_folder_exists = db.query(
-            exists().where(Folder.user_id == user_id, Folder.id == folder_id)
-        ).scalar()
+        user_folder_exists = await db.scalar(
+            select(exists().where(Folder.user_id == user_id, Folder.id == folder_id))
+        )
         if not user_folder_exists:
             raise HTTPException(status_code=404, detail="Folder does not exist!")
 
-        folder_cte = (
-            select(Folder.id)
-            .where(
-                Folder.id == folder_id,
-                Folder.user_id == user_id
-            )
-            .cte(name="subfolders", recursive=True)
-        )
-        subfolder = aliased(Folder)
-        folder_cte = folder_cte.union_all(
-            select(subfolder.id).where(subfolder.parent_id == folder_cte.c.id)
-        )
+        subtree_ids = get_subtree_ids(folder_id, user_id)
         deck_ids_subquery = (
             select(FlashcardDeck.id)
-            .where(FlashcardDeck.folder_id.in_(folder_cte))
+            .where(FlashcardDeck.folder_id.in_(subtree_ids))
         )
 
-        due_flashcards = (
-            db.query(func.count(Flashcard.id))
-            .filter(
+        due_flashcards = await db.scalar(
+            select(func.count(Flashcard.id))
+            .where(
                 Flashcard.deck_id.in_(deck_ids_subquery),
                 or_(
-                    func.date(Flashcard.next_review) <= datetime.now(timezone.utc).date(),
+                    Flashcard.next_review < get_review_cutoff(),
                     Flashcard.next_review == None
                 )
             )
-            .scalar()
         )
 
-        done_flashcards = (
-            db.query(func.count(Flashcard.id))
-            .filter(
+        done_flashcards = await db.scalar(
+            select(func.count(Flashcard.id))
+            .where(
                 Flashcard.deck_id.in_(deck_ids_subquery),
-                func.date(Flashcard.next_review) > datetime.now(timezone.utc).date(),
+                Flashcard.next_review >= get_review_cutoff(),
                 Flashcard.next_review != None
             )
-            .scalar()
         )
 
         if due_flashcards == 0 and done_flashcards == 0:
@@ -647,46 +858,33 @@ async def get_flashcards_stats(
 async def get_notes_stats(
     folder_id: Optional[str] = None, 
     user_id: str = Depends(get_user_id_from_jwt), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         folder_id = folder_id if folder_id != "home" else user_id
 
-        user_folder_exists = db.query(
-            exists().where(Folder.user_id == user_id, Folder.id == folder_id)
-        ).scalar()
+        user_folder_exists = await db.scalar(
+            select(exists().where(Folder.user_id == user_id, Folder.id == folder_id))
+        )
         if not user_folder_exists:
             raise HTTPException(status_code=404, detail="Folder does not exist!")
 
-        folder_cte = (
-            select(Folder.id)
-            .where(
-                Folder.id == folder_id,
-                Folder.user_id == user_id
-            )
-            .cte(name="subfolders", recursive=True)
-        )
-        subfolder = aliased(Folder)
-        folder_cte = folder_cte.union_all(
-            select(subfolder.id).where(subfolder.parent_id == folder_cte.c.id)
-        )
+        subtree_ids = get_subtree_ids(folder_id, user_id)
 
-        due_notes = (
-            db.query(func.count(Note.id))
-            .filter(
-                Note.folder_id.in_(folder_cte),
+        due_notes = await db.scalar(
+            select(func.count(Note.id))
+            .where(
+                Note.folder_id.in_(subtree_ids),
                 Note.read == False
             )
-            .scalar()
         )
 
-        read_notes = (
-            db.query(func.count(Note.id))
-            .filter(
-                Note.folder_id.in_(folder_cte),
+        read_notes = await db.scalar(
+            select(func.count(Note.id))
+            .where(
+                Note.folder_id.in_(subtree_ids),
                 Note.read == True
             )
-            .scalar()
         )
      
         if read_notes == 0 and due_notes == 0:
@@ -698,4 +896,102 @@ async def get_notes_stats(
         })
     except Exception as e:
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@study_units.get("/folder-stats")
+async def get_folder_stats(
+    folder_id: Optional[str] = None, 
+    user_id: str = Depends(get_user_id_from_jwt), 
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        folder_id = folder_id if folder_id != "home" else user_id
+
+        stats = folder_stats_cache.get(user_id, folder_id)
+        if stats is not None:
+            return JSONResponse(content=stats)
+
+        subtree_ids = get_subtree_ids(folder_id, user_id).cte(name="subtree")
+        review_cutoff = get_review_cutoff()
+
+        # Each subquery aggregates to a single row, so the cross join is one row
+        flashcards_stats = (
+            select(
+                func.count(case(
+                    (or_(Flashcard.next_review < review_cutoff, Flashcard.next_review == None), Flashcard.id)
+                )).label("due"),
+                func.count(case(
+                    (Flashcard.next_review >= review_cutoff, Flashcard.id)
+                )).label("done")
+            )
+            .join(FlashcardDeck, FlashcardDeck.id == Flashcard.deck_id)
+            .where(FlashcardDeck.folder_id.in_(select(subtree_ids)))
+            .subquery()
+        )
+        notes_stats = (
+            select(
+                func.count(case((Note.read == False, Note.id))).label("due"),
+                func.count(case((Note.read == True, Note.id))).label("read")
+            )
+            .where(Note.folder_id.in_(select(subtree_ids)))
+            .subquery()
+        )
+        avg_accuracy_subquery = (
+            select(func.avg(TestItemReview.accuracy).label("avg_accuracy"))
+            .select_from(TestItem)
+            .join(Test, Test.id == TestItem.test_id)
+            .outerjoin(TestItemReview, TestItemReview.test_item_id == TestItem.id)
+            .where(Test.folder_id.in_(select(subtree_ids)))
+            .group_by(TestItem.id)
+            .subquery()
+        )
+        test_items_stats = (
+            select(
+                func.count().label("total"),
+                func.count(case(
+                    (avg_accuracy_subquery.c.avg_accuracy >= 0.9, 1)
+                )).label("correct")
+            )
+            .select_from(avg_accuracy_subquery)
+            .subquery()
+        )
+        result = (await db.execute(
+            select(
+                exists().where(Folder.id == folder_id, Folder.user_id == user_id).label("folder_exists"),
+                flashcards_stats.c.due.label("flashcards_due"),
+                flashcards_stats.c.done.label("flashcards_done"),
+                notes_stats.c.due.label("notes_due"),
+                notes_stats.c.read.label("notes_read"),
+                test_items_stats.c.total.label("test_items_total"),
+                test_items_stats.c.correct.label("test_items_correct")
+            )
+            .select_from(flashcards_stats)
+            .join(notes_stats, true())
+            .join(test_items_stats, true())
+        )).one()
+
+        if not result.folder_exists:
+            raise HTTPException(status_code=404, detail="Folder does not exist!")
+
+        stats = {
+            "flashcards": {
+                "due": result.flashcards_due,
+                "done": result.flashcards_done
+            } if result.flashcards_due or result.flashcards_done else None,
+            "notes": {
+                "due": result.notes_due,
+                "read": result.notes_read
+            } if result.notes_due or result.notes_read else None,
+            "test_items": {
+                "total": result.test_items_total,
+                "correct": result.test_items_correct
+            } if result.test_items_total else None
+        }
+        folder_stats_cache.set(user_id, folder_id, stats)
+        return JSONResponse(content=stats)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import os
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
@@ -12,6 +13,14 @@ db_pass = os.getenv("CM_DB_PASS", "postgres")
 db_host = os.getenv("CM_DB_HOST",  "localhost")
 db_port = os.getenv("CM_DB_PORT", 5455)
 SQLALCHEMY_DATABASE_URL = f"postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
+
+# Connection pool of the async engine used by the request handlers
+db_pool_size = int(os.getenv("CM_DB_POOL_SIZE", 10))
+db_max_overflow = int(os.getenv("CM_DB_MAX_OVERFLOW", 20))
+db_pool_timeout = float(os.getenv("CM_DB_POOL_TIMEOUT", 30))
+db_pool_recycle = int(os.getenv("CM_DB_POOL_RECYCLE", 1800))
+db_pool_pre_ping = os.getenv("CM_DB_POOL_PRE_PING", "true").lower() == "true"
 
 def create_database_if_not_exists():
     try:
@@ -41,13 +50,20 @@ def create_database_if_not_exists():
 
 
 create_database_if_not_exists()
+# The sync engine only runs the schema setup at startup
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    pool_size=db_pool_size,
+    max_overflow=db_max_overflow,
+    pool_timeout=db_pool_timeout,
+    pool_recycle=db_pool_recycle,
+    pool_pre_ping=db_pool_pre_ping
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -1,6 +1,7 @@
 from sqlalchemy import (
     Column, Integer, String, 
-    ForeignKey, DateTime, Boolean, Float
+    ForeignKey, DateTime, Boolean, Float, Index,
+    TypeDecorator
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID, JSONB
@@ -10,13 +11,24 @@ import uuid
 from .database import Base
 
 
+class UTCDateTime(TypeDecorator):
+    # asyncpg rejects aware datetimes for "timestamp without time zone" columns
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
 class Folder(Base):
     __tablename__ = "folders"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     parent_id = Column(UUID(as_uuid=True), ForeignKey("folders.id"), nullable=True, index=True)
     name = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=False)
     user_id = Column(UUID(as_uuid=True), nullable=False)
     public = Column(Boolean, default=False, nullable=False)
 
@@ -29,6 +41,15 @@ class Folder(Base):
     notes = relationship("Note", backref="folder", cascade="all, delete-orphan")
 
 
+class FolderClosure(Base):
+    __tablename__ = "folder_closure"
+
+    # One row per (ancestor, descendant) pair, including each folder with itself at depth 0
+    ancestor_id = Column(UUID(as_uuid=True), ForeignKey("folders.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(UUID(as_uuid=True), ForeignKey("folders.id", ondelete="CASCADE"), primary_key=True, index=True)
+    depth = Column(Integer, nullable=False)
+
+
 class File(Base):
     __tablename__ = "files"
 
@@ -36,8 +57,9 @@ class File(Base):
     folder_id = Column(UUID(as_uuid=True), ForeignKey("folders.id"), nullable=False)
     name = Column(String, nullable=False)
     extension = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=False)
     public = Column(Boolean, default=False, nullable=False)
+    content_hash = Column(String, nullable=True) # sha256 of the stored blob
 
 
 class FlashcardDeck(Base):
@@ -46,7 +68,7 @@ class FlashcardDeck(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     folder_id = Column(UUID(as_uuid=True), ForeignKey("folders.id"), nullable=False)
     name = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=False)
     public = Column(Boolean, default=False, nullable=False)
 
     flashcards = relationship("Flashcard", backref="deck", cascade="all, delete-orphan")
@@ -58,19 +80,24 @@ class Flashcard(Base):
     id = Column(Integer, primary_key=True, nullable=False)
     deck_id = Column(UUID(as_uuid=True), ForeignKey("flashcard_decks.id"), nullable=False, index=True)
     type = Column(String, nullable=False)
-    next_review = Column(DateTime, nullable=True, index=True)
+    next_review = Column(UTCDateTime, nullable=True, index=True)
     content = Column(JSONB, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=False)
     fsrs_card = Column(JSONB, nullable=True)
 
     flashcard_reviews = relationship("FlashcardReview", backref="flashcard", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Unscheduled cards come first in the review queue, so the index keeps them first too
+        Index("ix_flashcards_deck_next_review_nulls_first", "deck_id", next_review.asc().nullsfirst(), "id"),
+    )
+
 
 class FlashcardReview(Base):
     __tablename__ = "flashcard_reviews"
 
     id = Column(Integer, primary_key=True, nullable=False)
-    flashcard_id = Column(Integer, ForeignKey("flashcards.id"), nullable=False)
+    flashcard_id = Column(Integer, ForeignKey("flashcards.id"), nullable=False, index=True)
     fsrs_review = Column(JSONB, nullable=False)
     # reviewed_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=True)
     # score = Column(Integer, nullable=False)
@@ -83,7 +110,7 @@ class Test(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     folder_id = Column(UUID(as_uuid=True), ForeignKey("folders.id"), nullable=False)
     name = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=False)
     public = Column(Boolean, default=False, nullable=False)
 
     test_items = relationship("TestItem", backref="test", cascade="all, delete-orphan")
@@ -96,7 +123,7 @@ class TestItem(Base):
     test_id = Column(UUID(as_uuid=True), ForeignKey("tests.id"), nullable=False)
     content = Column(JSONB, nullable=False)
     type = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=False)
 
     test_item_reviews = relationship(
         "TestItemReview", 
@@ -112,7 +139,7 @@ class TestSession(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     origin_id = Column(UUID(as_uuid=True), nullable=False) # test/folder id
     status = Column(String, nullable=False) # done/ongoing
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=True)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=True)
 
 
 class TestItemReview(Base):
@@ -121,11 +148,15 @@ class TestItemReview(Base):
     id = Column(Integer, primary_key=True, nullable=False)
     test_session = Column(UUID(as_uuid=True), ForeignKey("test_sessions.id"), nullable=False)
     test_item_id = Column(Integer, ForeignKey("test_items.id"), nullable=False)
-    reviewed_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=True)
+    reviewed_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=True)
     accuracy = Column(Float, nullable=False)
     answers = Column(JSONB, nullable=False)
     duration = Column(Float, nullable=True)
 
+    __table_args__ = (
+        Index("ix_test_item_reviews_session_item", "test_session", "test_item_id"),
+    )
+
 
 class Note(Base):
     __tablename__ = "notes"
@@ -135,6 +166,6 @@ class Note(Base):
     name = Column(String, nullable=False)
     content = Column(String, nullable=False)
     type = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc), nullable=False)
     public = Column(Boolean, default=False, nullable=False)
     read = Column(Boolean, default=False)
\ No newline at end of file
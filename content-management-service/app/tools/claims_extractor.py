@@ -1,8 +1,13 @@
 import jwt
+import hmac
+import os
 from typing import Optional
 from fastapi import Header, HTTPException
 
 
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN")
+
+
 def get_user_id_from_jwt(
     authorization: Optional[str] = Header(None)
 ) -> str:
@@ -14,4 +19,12 @@ def get_user_id_from_jwt(
         payload = jwt.decode(token, options={"verify_signature": False})
         return payload.get("user_id")
     except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+
+
+def verify_service_token(
+    x_service_token: Optional[str] = Header(None)
+):
+    # For endpoints only other services may call, since the gateway lets any user's JWT through
+    if not SERVICE_TOKEN or not x_service_token or not hmac.compare_digest(x_service_token, SERVICE_TOKEN):
+        raise HTTPException(status_code=403, detail="Service token required")
@@ -0,0 +1,126 @@
+from sqlalchemy import select, delete, literal, exists
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import insert, UUID
+
+from ..models import (
+    Folder, FolderClosure, File, FlashcardDeck, Flashcard,
+    FlashcardReview, Test, TestItem, TestItemReview, Note
+)
+
+
+def get_subtree_ids(folder_id, user_id=None):
+    """Select the ids of a folder and all of its subfolders from the closure table."""
+    subtree = select(FolderClosure.descendant_id).where(FolderClosure.ancestor_id == folder_id)
+    if user_id:
+        subtree = (
+            subtree
+            .join(Folder, Folder.id == FolderClosure.ancestor_id)
+            .where(Folder.user_id == user_id)
+        )
+    return subtree
+
+
+async def delete_subtree(db, folder_id):
+    """Delete a folder, its subfolders and everything in them with one DELETE per table.
+
+    Returns the deleted folder ids and the deleted files' (id, extension, content_hash) rows,
+    so their cached stats and storage can be cleaned up once the transaction commits.
+    """
+    folder_ids = (await db.execute(get_subtree_ids(folder_id))).scalars().all()
+    if not folder_ids:
+        return [], []
+
+    deck_ids = select(FlashcardDeck.id).where(FlashcardDeck.folder_id.in_(folder_ids))
+    flashcard_ids = select(Flashcard.id).where(Flashcard.deck_id.in_(deck_ids))
+    test_ids = select(Test.id).where(Test.folder_id.in_(folder_ids))
+    test_item_ids = select(TestItem.id).where(TestItem.test_id.in_(test_ids))
+
+    # Children before parents, since the foreign keys do not cascade in the database
+    statements = [
+        delete(FlashcardReview).where(FlashcardReview.flashcard_id.in_(flashcard_ids)),
+        delete(Flashcard).where(Flashcard.deck_id.in_(deck_ids)),
+        delete(FlashcardDeck).where(FlashcardDeck.folder_id.in_(folder_ids)),
+        delete(TestItemReview).where(TestItemReview.test_item_id.in_(test_item_ids)),
+        delete(TestItem).where(TestItem.test_id.in_(test_ids)),
+        delete(Test).where(Test.folder_id.in_(folder_ids)),
+        delete(Note).where(Note.folder_id.in_(folder_ids)),
+    ]
+    for statement in statements:
+        # Nothing is loaded in the session, so there is nothing to synchronize
+        await db.execute(statement.execution_options(synchronize_session=False))
+    deleted_files = (await db.execute(
+        delete(File)
+        .where(File.folder_id.in_(folder_ids))
+        .returning(File.id, File.extension, File.content_hash)
+        .execution_options(synchronize_session=False)
+    )).all()
+    # The closure rows go with their folders through ON DELETE CASCADE
+    await db.execute(
+        delete(Folder)
+        .where(Folder.id.in_(folder_ids))
+        .execution_options(synchronize_session=False)
+    )
+    return folder_ids, deleted_files
+
+
+async def add_folder_to_tree(db, folder_id, parent_id=None):
+    """Link a newly created folder to itself and to every ancestor of its parent."""
+    await db.execute(
+        insert(FolderClosure)
+        .values(ancestor_id=folder_id, descendant_id=folder_id, depth=0)
+    )
+    if parent_id:
+        await db.execute(
+            insert(FolderClosure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(
+                    FolderClosure.ancestor_id,
+                    literal(folder_id, UUID(as_uuid=True)),
+                    FolderClosure.depth + 1
+                )
+                .where(FolderClosure.descendant_id == parent_id)
+            )
+        )
+
+
+def rebuild_folder_closure(engine):
+    """Fill in the closure rows for folders created before the table existed."""
+    with engine.begin() as conn:
+        missing = conn.execute(
+            select(
+                exists().where(
+                    ~exists().where(
+                        FolderClosure.ancestor_id == Folder.id,
+                        FolderClosure.descendant_id == Folder.id
+                    )
+                )
+            )
+        ).scalar()
+        if not missing:
+            return
+
+        tree_cte = (
+            select(
+                Folder.id.label("ancestor_id"),
+                Folder.id.label("descendant_id"),
+                literal(0).label("depth")
+            )
+            .cte(name="tree", recursive=True)
+        )
+        subfolder = aliased(Folder)
+        tree_cte = tree_cte.union_all(
+            select(
+                tree_cte.c.ancestor_id,
+                subfolder.id,
+                tree_cte.c.depth + 1
+            )
+            .where(subfolder.parent_id == tree_cte.c.descendant_id)
+        )
+        conn.execute(
+            insert(FolderClosure)
+            .from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(tree_cte.c.ancestor_id, tree_cte.c.descendant_id, tree_cte.c.depth)
+            )
+            .on_conflict_do_nothing()
+        )
@@ -0,0 +1,114 @@
+import asyncio
+import time
+import os
+
+import httpx
+
+
+SERVICE_TIMEOUT = float(os.getenv("SERVICE_TIMEOUT", 30))
+SERVICE_RETRIES = int(os.getenv("SERVICE_RETRIES", 3))
+SERVICE_BACKOFF = float(os.getenv("SERVICE_BACKOFF", 0.5))
+SERVICE_MAX_CONNECTIONS = int(os.getenv("SERVICE_MAX_CONNECTIONS", 100))
+
+# Errors after which the request surely never reached the handler
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+RETRY_STATUSES = {502, 503, 504}
+
+
+class ServiceClient:
+    """Keep-alive connection pools to one service, for async handlers and for sync workers.
+
+    Failed calls are retried with exponential backoff. Non-idempotent calls (POST by default)
+    are only retried when the request was never sent, so a save is not applied twice.
+    """
+    def __init__(
+        self,
+        base_url,
+        timeout=SERVICE_TIMEOUT,
+        retries=SERVICE_RETRIES,
+        backoff=SERVICE_BACKOFF,
+        max_connections=SERVICE_MAX_CONNECTIONS,
+        headers=None
+    ):
+        self.base_url = base_url or ""
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._async_client = None
+        self._sync_client = None
+        self._pid = None
+
+    def get_async_client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self.headers, timeout=self.timeout, limits=self.limits
+            )
+        return self._async_client
+
+    def get_sync_client(self):
+        # Forked workers must not share the parent's sockets
+        if self._sync_client is None or self._pid != os.getpid():
+            self._sync_client = httpx.Client(
+                base_url=self.base_url, headers=self.headers, timeout=self.timeout, limits=self.limits
+            )
+            self._pid = os.getpid()
+        return self._sync_client
+
+    def should_retry(self, attempt, idempotent, response=None, error=None):
+        if attempt >= self.retries:
+            return False
+        if error is not None:
+            return isinstance(error, UNSENT_ERRORS) or (idempotent and isinstance(error, httpx.TransportError))
+        return response.status_code == 503 or (idempotent and response.status_code in RETRY_STATUSES)
+
+    def get_delay(self, attempt):
+        return self.backoff * 2 ** attempt
+
+    async def request(self, method, path, idempotent=None, **kwargs):
+        idempotent = method in ("GET", "HEAD", "PUT", "DELETE") if idempotent is None else idempotent
+        attempt = 0
+        while True:
+            try:
+                response = await self.get_async_client().request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self.should_retry(attempt, idempotent, error=e):
+                    raise
+            else:
+                if not self.should_retry(attempt, idempotent, response=response):
+                    return response
+            await asyncio.sleep(self.get_delay(attempt))
+            attempt += 1
+
+    def request_sync(self, method, path, idempotent=None, **kwargs):
+        idempotent = method in ("GET", "HEAD", "PUT", "DELETE") if idempotent is None else idempotent
+        attempt = 0
+        while True:
+            try:
+                response = self.get_sync_client().request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self.should_retry(attempt, idempotent, error=e):
+                    raise
+            else:
+                if not self.should_retry(attempt, idempotent, response=response):
+                    return response
+            time.sleep(self.get_delay(attempt))
+            attempt += 1
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    def get_sync(self, path, **kwargs):
+        return self.request_sync("GET", path, **kwargs)
+
+    def post_sync(self, path, **kwargs):
+        return self.request_sync("POST", path, **kwargs)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
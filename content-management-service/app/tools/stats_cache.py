@@ -0,0 +1,51 @@
+from sqlalchemy import select
+from threading import Lock
+import time
+import os
+
+from ..models import FolderClosure
+
+
+FOLDER_STATS_TTL = float(os.getenv("FOLDER_STATS_TTL", 60))
+
+
+class FolderStatsCache:
+    def __init__(self, ttl=FOLDER_STATS_TTL):
+        self.ttl = ttl
+        self._entries = {} # (user_id, folder_id) -> (expires_at, stats)
+        self._lock = Lock()
+
+    def get(self, user_id, folder_id):
+        with self._lock:
+            entry = self._entries.get((str(user_id), str(folder_id)))
+            if not entry:
+                return None
+            expires_at, stats = entry
+            if expires_at < time.monotonic():
+                del self._entries[(str(user_id), str(folder_id))]
+                return None
+            return stats
+
+    def set(self, user_id, folder_id, stats):
+        with self._lock:
+            self._entries[(str(user_id), str(folder_id))] = (time.monotonic() + self.ttl, stats)
+
+    def invalidate(self, folder_ids):
+        folder_ids = {str(folder_id) for folder_id in folder_ids}
+        with self._lock:
+            for key in [key for key in self._entries if key[1] in folder_ids]:
+                del self._entries[key]
+
+
+folder_stats_cache = FolderStatsCache()
+
+
+async def invalidate_folder_stats(db, folder_id):
+    """Drop the cached stats of a folder and of every folder above it."""
+    if not folder_id:
+        return
+    ancestor_ids = (await db.execute(
+        select(FolderClosure.ancestor_id)
+        .where(FolderClosure.descendant_id == folder_id)
+    )).scalars().all()
+    folder_stats_cache.invalidate([folder_id, *ancestor_ids])
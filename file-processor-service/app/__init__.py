@@ -3,21 +3,39 @@ from dotenv import load_dotenv
 import os
 from fastapi.middleware.cors import CORSMiddleware
 from celery import Celery
+import redis
 
 
 from .tools.ai_manager import AIFactory
+from .tools.redis_cache import RedisLRUCache
+from .tools.service_client import ServiceClient
 
 load_dotenv()
 
 REDIS_HOST = os.getenv("REDIS_HOST")
 CONTENT_MANAGEMENT_SERVICE = os.getenv("CONTENT_MANAGEMENT_SERVICE")
-ai_factory = AIFactory()
+AI_RESPONSE_CACHE_MAX_MB = int(os.getenv("AI_RESPONSE_CACHE_MAX_MB", 256))
+AI_RESPONSE_CACHE_TTL = int(os.getenv("AI_RESPONSE_CACHE_TTL", 24 * 3600))
+
+redis_client = redis.Redis.from_url(f"redis://{REDIS_HOST}")
+ai_response_cache = RedisLRUCache(
+    client=redis_client,
+    prefix="ai_response:",
+    max_bytes=AI_RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+    ttl=AI_RESPONSE_CACHE_TTL
+)
+ai_factory = AIFactory(response_cache=ai_response_cache)
+content_client = ServiceClient(CONTENT_MANAGEMENT_SERVICE)
 celery_app = Celery(
     'app',
     broker=f'redis://{REDIS_HOST}',
     backend=f'redis://{REDIS_HOST}',
     include=["app.apis.study_units_generator"]
 )
+# Extraction fans out to its own process pool, so it runs on a separate worker
+celery_app.conf.task_routes = {
+    "app.apis.study_units_generator.extract_text_task": {"queue": "extraction"}
+}
 
 
 def create_app():
@@ -36,6 +54,7 @@ def create_app():
     app.include_router(study_units_generator)
     app.include_router(file_uploader)
     app.include_router(chatbot)
+    app.add_event_handler("shutdown", content_client.aclose)
    
 
     return app
\ No newline at end of file
@@ -1,28 +1,27 @@
-from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Depends
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Depends, Request, BackgroundTasks, Header
 from fastapi.responses import FileResponse, Response, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
 from typing import List, Optional
 import os
-import shutil
-import requests
-from uuid import uuid4
+from uuid import uuid4, UUID
 import traceback
 #import pyclamd
-import shutil
-import subprocess
-import tempfile
 
 
-from .. import CONTENT_MANAGEMENT_SERVICE
+from .. import content_client
 from ..tools.claims_extractor import get_user_id_from_jwt
+from ..tools.blob_store import store_file
+from ..tools.chunked_uploads import ChunkedUpload, UploadError, remove_expired_uploads
+from ..tools.pdf_renditions import get_pdf_rendition, ConversionError, PoolBusyError, CONVERTIBLE_EXTENSIONS
 
 
 file_uploader = APIRouter()
 
 
-def save_file_to_storage(file, unique_name):
-    file_path = os.path.join("files", unique_name)
-    with open(file_path, "wb") as out_file:
-        shutil.copyfileobj(file.file, out_file)
+async def save_file_to_storage(file, unique_name):
+    # Copied on a worker thread, so large uploads don't block the event loop
+    return await run_in_threadpool(store_file, file.file, unique_name)
 
 
 def scan_file_in_memory(file: UploadFile):
@@ -35,8 +34,37 @@ def scan_file_in_memory(file: UploadFile):
     file.file.seek(0)
     return result
 
+
+async def prepare_pdf_rendition(file_path):
+    try:
+        await get_pdf_rendition(file_path)
+    except Exception:
+        # The rendition is retried when the file is opened
+        traceback.print_exc()
+
+async def save_file_names(uploaded_files, folder_id, background_tasks):
+    # Save the file names
+    response = await content_client.post(
+        "/save-file-names",
+        json={
+            "file_metadata": uploaded_files,
+            "folder_id": folder_id
+        }
+    )
+    print(response.json())
+    response.raise_for_status()
+
+    # Convert office files ahead of the first view
+    for uploaded_file in uploaded_files:
+        if uploaded_file["extension"].lower() in CONVERTIBLE_EXTENSIONS:
+            background_tasks.add_task(
+                prepare_pdf_rendition,
+                os.path.join("files", uploaded_file["file_id"] + "." + uploaded_file["extension"])
+            )
+
 @file_uploader.post("/upload-files")
 async def upload_files(
+    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...), 
     folder_id: Optional[str] = Form(...),
     user_id: str = Depends(get_user_id_from_jwt)
@@ -52,35 +80,135 @@ async def upload_files(
 
                 file_id = str(uuid4())
                 _, extension = os.path.splitext(file.filename)
-                save_file_to_storage(file, file_id + extension)
+                content_hash = await save_file_to_storage(file, file_id + extension)
                 extension = extension.lstrip(".")
                 uploaded_files.append({
                     "file_id": file_id,
                     "extension": extension,
-                    "name": file.filename
+                    "name": file.filename,
+                    "content_hash": content_hash
                 })
             except Exception as e:
                 raise HTTPException(status_code=400, detail=f"Failed to upload {file.filename}: {str(e)}")
 
-        # Save the file names
-        response = requests.post(
-            url=CONTENT_MANAGEMENT_SERVICE + "/save-file-names",
-            json={
-                "file_metadata": uploaded_files,
-                "folder_id": folder_id
-            }
-        )
-        print(response.json())
-        response.raise_for_status()
-
+        await save_file_names(uploaded_files, folder_id, background_tasks)
         return {"msg": "Files uploaded!", "file_metadata": uploaded_files}
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
 
+class InitUploadRequest(BaseModel):
+    filename: str
+    size: int
+    folder_id: Optional[str] = None
+    sha256: Optional[str] = None # checked against the assembled file on completion
+
+@file_uploader.post("/uploads")
+async def init_upload(
+    request_data: InitUploadRequest,
+    user_id: str = Depends(get_user_id_from_jwt)
+):
+    try:
+        await run_in_threadpool(remove_expired_uploads)
+        upload_id = str(uuid4())
+        upload = await run_in_threadpool(ChunkedUpload.create, upload_id, {
+            **request_data.dict(),
+            "folder_id": request_data.folder_id if request_data.folder_id != "home" else user_id,
+            "user_id": user_id
+        })
+        return {
+            "upload_id": upload_id,
+            "part_size": upload.meta["part_size"],
+            "parts_num": upload.parts_num
+        }
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def get_user_upload(upload_id, user_id):
+    try:
+        upload = ChunkedUpload(str(UUID(upload_id)))
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.meta["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+@file_uploader.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: str, user_id: str = Depends(get_user_id_from_jwt)):
+    upload = get_user_upload(upload_id, user_id)
+    return {
+        "upload_id": upload_id,
+        "part_size": upload.meta["part_size"],
+        "parts_num": upload.parts_num,
+        "received_parts": upload.get_received_parts()
+    }
+
+
+@file_uploader.put("/uploads/{upload_id}/parts/{part_index}")
+async def upload_part(
+    upload_id: str,
+    part_index: int,
+    request: Request,
+    x_part_sha256: str = Header(...),
+    user_id: str = Depends(get_user_id_from_jwt)
+):
+    upload = get_user_upload(upload_id, user_id)
+    try:
+        # Read incrementally, so an oversized part is refused without buffering all of it
+        data = bytearray()
+        async for chunk in request.stream():
+            data.extend(chunk)
+            if len(data) > upload.meta["part_size"]:
+                raise UploadError("Part is too large")
+        await run_in_threadpool(upload.write_part, part_index, bytes(data), x_part_sha256)
+        return {"part_index": part_index}
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@file_uploader.post("/uploads/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(get_user_id_from_jwt)
+):
+    upload = get_user_upload(upload_id, user_id)
+    try:
+        file_id = str(uuid4())
+        _, extension = os.path.splitext(upload.meta["filename"])
+        content_hash = await run_in_threadpool(upload.complete, file_id + extension)
+        uploaded_files = [{
+            "file_id": file_id,
+            "extension": extension.lstrip("."),
+            "name": upload.meta["filename"],
+            "content_hash": content_hash
+        }]
+        try:
+            await save_file_names(uploaded_files, upload.meta["folder_id"], background_tasks)
+        except Exception:
+            # Left unregistered, so the client can retry completing the upload
+            await run_in_threadpool(upload.unlink_file, file_id + extension, content_hash)
+            raise
+        await run_in_threadpool(upload.delete)
+        return {"msg": "Files uploaded!", "file_metadata": uploaded_files}
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @file_uploader.get("/file")
-async def get_file(file_id: str, file_extension: str):
+async def get_file(file_id: str, file_extension: str, request: Request):
     input_path = os.path.join("files", f"{file_id}.{file_extension}")
 
     if os.path.exists(input_path):
@@ -91,28 +219,29 @@ async def get_file(file_id: str, file_extension: str):
                 filename=f"{file_id}.pdf"
             )
         else:
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                result = subprocess.run([
-                    "libreoffice", "--headless", "--convert-to", "pdf",
-                    "--outdir", tmp_dir, input_path
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-                if result.returncode != 0:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Conversion failed: {result.stderr.decode()}"
-                    )
-
-                temp_pdf_path = os.path.join(tmp_dir, f"{file_id}.pdf")
-                with open(temp_pdf_path, "rb") as f:
-                    pdf_content = f.read()
-
-            return Response(
-                content=pdf_content,
+            try:
+                pdf_path, content_hash = await get_pdf_rendition(input_path)
+            except PoolBusyError as e:
+                raise HTTPException(
+                    status_code=503,
+                    detail=str(e),
+                    headers={"Retry-After": "5"}
+                )
+            except ConversionError as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Conversion failed: {str(e)}"
+                )
+
+            # Renditions are keyed by content, so the hash is a strong validator
+            etag = f'"{content_hash}"'
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            return FileResponse(
+                path=pdf_path,
                 media_type="application/pdf",
-                headers={
-                    "Content-Disposition": f"attachment; filename={file_id}.pdf"
-                }
+                filename=f"{file_id}.pdf",
+                headers={"ETag": etag}
             )
 
-    raise HTTPException(status_code=404, detail="File not found")
\ No newline at end of file
+    raise HTTPException(status_code=404, detail="File not found")
@@ -2,23 +2,32 @@ from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse
 from typing import List
 import traceback
-import tempfile
+import multiprocessing
+import time
+import os
+from functools import partial
 from pydantic import BaseModel
 from typing import Literal, Optional
 from datetime import datetime, timezone
-import requests
+from celery import group
 from celery.result import AsyncResult
 
 from ..tools.text_extractor import text_extractor_factory
+from ..tools.text_cache import get_cached_text, cache_text
+from ..tools.extraction_pool import extraction_pool
+from ..tools.text_store import store_text, shared_text
+from ..tools.chunked_generation import (
+    generate_per_chunk, get_chunk_amount, merge_flashcards, merge_notes, merge_tests
+)
 from .. import ai_factory
 from ..tools.prompts.flashcards_prompt import get_flashcards_system_prompt
 from ..tools.prompts.notes_prompt import get_notes_system_prompt
-from .. import CONTENT_MANAGEMENT_SERVICE
-from .. import celery_app
+from .. import content_client
+from .. import celery_app, ai_response_cache
 from .. import ai_factory
-from ..tools.prompts.flashcards_prompt import get_flashcards_system_prompt
-from ..tools.prompts.notes_prompt import get_notes_system_prompt
-from ..tools.prompts.tests_prompt import get_test_system_prompt
+from ..tools.prompts.flashcards_prompt import get_flashcards_system_prompt, get_flashcards_output_schema
+from ..tools.prompts.notes_prompt import get_notes_system_prompt, get_notes_output_schema
+from ..tools.prompts.tests_prompt import get_test_system_prompt, get_test_output_schema
 from ..tools.claims_extractor import get_user_id_from_jwt
 from ..tools.link_extractor import extract_link_main_content, get_youtube_transcript_auto
 
@@ -26,29 +35,121 @@ from ..tools.link_extractor import extract_link_main_content, get_youtube_transc
 study_units_generator = APIRouter()
 
 
-def get_file_from_storage(storage_name):
-    with open("files/" + storage_name, "rb") as file:
-        return file.read()
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", 300))
+
+
+def report_extraction_progress(task_ids, file_id, progress):
+    # Shown through the generation tasks' status endpoints until they start
+    for task_id in task_ids:
+        celery_app.backend.store_result(
+            task_id,
+            {"stage": "extraction", "file_id": file_id, **progress},
+            "PROGRESS"
+        )
+
+
+def get_file_path(file_meta):
+    # Extractors read the stored file in place
+    return os.path.join("files", file_meta["file_id"] + "." + file_meta["extension"])
+
+
+def extract_file_text(file_meta, progress_task_ids=None):
+    text_extractor = text_extractor_factory.get_text_extractor(file_meta["extension"])
+    on_progress = None
+    if progress_task_ids:
+        on_progress = partial(report_extraction_progress, progress_task_ids, file_meta["file_id"])
+    return text_extractor.extract_text(get_file_path(file_meta), file_meta["extension"], on_progress)
+
+
+def extract_files_text(file_metadata, progress_task_ids=None):
+    """Extract the files concurrently, skipping any that fail or run past the timeout."""
+    texts = {}
+    uncached = [] # (index, cache key)
+    for i, file_meta in enumerate(file_metadata):
+        text_extractor = text_extractor_factory.get_text_extractor(file_meta["extension"])
+        key, text = get_cached_text(get_file_path(file_meta), text_extractor)
+        if text is not None:
+            texts[i] = text
+        else:
+            uncached.append((i, key))
+
+    if uncached:
+        # Even a single file goes to the pool, which is what enforces the timeout
+        with extraction_pool.acquire() as pool:
+            results = [
+                (i, key, *extraction_pool.submit(
+                    pool, extract_file_text, (file_metadata[i], progress_task_ids), EXTRACTION_TIMEOUT
+                ))
+                for i, key in uncached
+            ]
+            for i, key, result, deadline in results:
+                try:
+                    texts[i] = result.get(timeout=max(deadline - time.monotonic(), 0))
+                    cache_text(key, texts[i])
+                except multiprocessing.TimeoutError:
+                    print("Extraction timed out:", file_metadata[i]["file_id"])
+                    # The stuck process goes with the pool once this extraction lets go of it
+                    extraction_pool.retire(pool)
+                except Exception:
+                    traceback.print_exc()
+    return [texts[i] for i in sorted(texts)]
+
+
+def extract_text(file_metadata=None, link=None, topic=None, progress_task_ids=None):
+    extracted_text = ""
+    if file_metadata:
+        for text in extract_files_text(file_metadata, progress_task_ids):
+            if text:
+                extracted_text += text + "\n"
+    elif link:
+        if "youtube.com" in link:
+            extracted_text = get_youtube_transcript_auto(link)
+        if not extracted_text:
+            extracted_text = extract_link_main_content(link)
+    elif topic:
+        extracted_text += f"Topic/Text: {topic}"
+
+    if extracted_text and link:
+        extracted_text += f"The source link to mention in notes: {link}"
+    return extracted_text
+
+
+@celery_app.task
+def extract_text_task(file_metadata=None, link=None, topic=None, progress_task_ids=None, readers=1):
+    try:
+        extracted_text = extract_text(file_metadata, link, topic, progress_task_ids)
+        # The generation tasks get a reference instead of a copy each through the broker
+        return store_text(extracted_text, readers)
+    except Exception:
+        # A failed chain never starts the group, whose ids the client is already polling,
+        # so the generation tasks get no text and fail on it instead
+        traceback.print_exc()
+        return None
 
 
 @celery_app.task
-def generate_flashcards_task(ai_model, extracted_text, flashcards_metadata, folder_id, user_id):
+def generate_flashcards_task(text_ref, ai_model, flashcards_metadata, folder_id, user_id, use_cache=True):
     ai = ai_factory.get_ai(ai_model)
 
-    flashcards, _ = ai.get_ai_res(
-        system_prompt=get_flashcards_system_prompt(
-            comprehensiveness=flashcards_metadata['comprehensiveness'],
-            verbosity=flashcards_metadata['verbosity'],
-            amount=flashcards_metadata['amount'],
-            flashcard_types=flashcards_metadata['types']
-        ),
-        user_prompt=extracted_text
-    )
+    with shared_text(text_ref) as extracted_text:
+        partial_decks = generate_per_chunk(
+            ai,
+            lambda chunks_num: get_flashcards_system_prompt(
+                comprehensiveness=flashcards_metadata['comprehensiveness'],
+                verbosity=flashcards_metadata['verbosity'],
+                amount=get_chunk_amount(flashcards_metadata['amount'], chunks_num),
+                flashcard_types=flashcards_metadata['types']
+            ),
+            extracted_text,
+            use_cache,
+            get_flashcards_output_schema(flashcards_metadata['types'])
+        )
+    flashcards = merge_flashcards(partial_decks, flashcards_metadata['amount'])
     deck_name = flashcards.pop("deck_name")
 
     # Save the flashcards in the content's db
-    response = requests.post(
-        url=CONTENT_MANAGEMENT_SERVICE + "/save-flashcards",
+    response = content_client.post_sync(
+        "/save-flashcards",
         json={
             "flashcards": flashcards,
             "deck_name": deck_name,
@@ -67,6 +168,8 @@ def generate_flashcards_task(ai_model, extracted_text, flashcards_metadata, fold
 @study_units_generator.get("/flashcards-status/{task_id}")
 def get_flashcard_status(task_id: str):
     task_result = AsyncResult(task_id, app=celery_app)
+    if task_result.failed():
+        return {"status": task_result.status}
     if task_result.ready():
         return {
             "status": task_result.status,
@@ -75,20 +178,26 @@ def get_flashcard_status(task_id: str):
             "name": task_result.result.get("deck_name"),
             "created_at": datetime.now(timezone.utc).isoformat()
         }
+    if task_result.status == "PROGRESS":
+        return {"status": task_result.status, "progress": task_result.info}
     return {"status": task_result.status}
 
 
 @celery_app.task
-def generate_note_task(ai_model, extracted_text, folder_id, user_id):
+def generate_note_task(text_ref, ai_model, folder_id, user_id, use_cache=True):
     ai = ai_factory.get_ai(ai_model)
-    note, _ = ai.get_ai_res(
-        system_prompt=get_notes_system_prompt(),
-        user_prompt=extracted_text
-    )
+    with shared_text(text_ref) as extracted_text:
+        note = merge_notes(generate_per_chunk(
+            ai,
+            lambda _: get_notes_system_prompt(),
+            extracted_text,
+            use_cache,
+            get_notes_output_schema()
+        ))
     
     # Save the flashcards in the content's db
-    response = requests.post(
-        url=CONTENT_MANAGEMENT_SERVICE + "/save-note",
+    response = content_client.post_sync(
+        "/save-note",
         json={
             "note_content": note.get("note_content"),
             "note_name": note.get("note_name"),
@@ -105,15 +214,19 @@ def generate_note_task(ai_model, extracted_text, folder_id, user_id):
 
 
 @celery_app.task
-def generate_test_task(ai_model, extracted_text, folder_id, user_id):
+def generate_test_task(text_ref, ai_model, folder_id, user_id, use_cache=True):
     ai = ai_factory.get_ai(ai_model)
-    test, _ = ai.get_ai_res(
-        system_prompt=get_test_system_prompt(),
-        user_prompt=extracted_text
-    )
-
-    response = requests.post(
-        url=CONTENT_MANAGEMENT_SERVICE + "/save-test",
+    with shared_text(text_ref) as extracted_text:
+        test = merge_tests(generate_per_chunk(
+            ai,
+            lambda _: get_test_system_prompt(),
+            extracted_text,
+            use_cache,
+            get_test_output_schema()
+        ))
+
+    response = content_client.post_sync(
+        "/save-test",
         json={
             "test_items": test.get("multiple_choice_test_items"),
             "test_name": test.get("test_name"),
@@ -132,6 +245,8 @@ def generate_test_task(ai_model, extracted_text, folder_id, user_id):
 @study_units_generator.get("/test-task-status/{task_id}")
 def get_test_task_status(task_id: str):
     task_result = AsyncResult(task_id, app=celery_app)
+    if task_result.failed():
+        return {"status": task_result.status}
     if task_result.ready():
         return {
             "status": task_result.status,
@@ -140,12 +255,16 @@ def get_test_task_status(task_id: str):
             "name": task_result.result.get("test_name"),
             "created_at": datetime.now(timezone.utc).isoformat()
         }
+    if task_result.status == "PROGRESS":
+        return {"status": task_result.status, "progress": task_result.info}
     return {"status": task_result.status}
 
 
 @study_units_generator.get("/note-task-status/{task_id}")
 def get_note_task_status(task_id: str):
     task_result = AsyncResult(task_id, app=celery_app)
+    if task_result.failed():
+        return {"status": task_result.status}
     if task_result.ready():
         return {
             "status": task_result.status,
@@ -154,8 +273,16 @@ def get_note_task_status(task_id: str):
             "name": task_result.result.get("note_name"),
             "created_at": datetime.now(timezone.utc).isoformat()
         }
+    if task_result.status == "PROGRESS":
+        return {"status": task_result.status, "progress": task_result.info}
     return {"status": task_result.status}
 
+
+@study_units_generator.get("/ai-cache-stats")
+def get_ai_cache_stats():
+    return ai_response_cache.stats()
+
+
 class FlashcardsMetadata(BaseModel):
     comprehensiveness: Optional[Literal["high", "medium", "low"]] = "medium"
     verbosity: Optional[Literal["high", "medium", "low"]] = "low"
@@ -181,6 +308,7 @@ class StudyUnitsMetadata(BaseModel):
     note: Optional[NoteMetadata] = None
     test: Optional[TestMetadata] = None
     ai_model: Optional[str] = None
+    use_cache: Optional[bool] = True # False regenerates even for an identical earlier request
 
 @study_units_generator.post("/generate-study-units")
 async def generate_study_units(
@@ -190,61 +318,55 @@ async def generate_study_units(
     try:
         folder_id = request_data.folder_id if request_data.folder_id != "home" else user_id
 
-        extracted_text = ""
-        if request_data.file_metadata:
-            for file_meta in request_data.file_metadata:
-                file_bytes = get_file_from_storage(file_meta.file_id + "." + file_meta.extension)
-
-                with tempfile.NamedTemporaryFile(suffix=file_meta.file_id, delete=True, dir="temp_files") as temp_file:
-                    temp_file.write(file_bytes)
-                    temp_file.flush()
-
-                    text_extractor = text_extractor_factory.get_text_extractor(file_meta.extension)
-                    extracted_text += text_extractor.extract_text(temp_file.name, file_meta.extension) + "\n"
-        elif request_data.link_metadata:
-            if "youtube.com" in request_data.link_metadata:
-                extracted_text = get_youtube_transcript_auto(request_data.link_metadata)
-            if not extracted_text:
-                extracted_text = extract_link_main_content(request_data.link_metadata)
-        elif request_data.topic_metadata:
-            extracted_text += f"Topic/Text: {request_data.topic_metadata}"
-
-        if not extracted_text:
+        if not (request_data.file_metadata or request_data.link_metadata or request_data.topic_metadata):
             return JSONResponse(
                 content={"msg": "Could not extract text!"},
                 status_code=400
             )
-        if request_data.link_metadata:
-            extracted_text += f"The source link to mention in notes: {request_data.link_metadata}"
 
-        response_data = {}        
+        # Each generation task gets the stored text's reference from the extraction stage
+        response_data = {}
+        generation_tasks = []
         if request_data.note:
-            note_task = generate_note_task.delay(
+            note_task = generate_note_task.s(
                 ai_model=request_data.ai_model, 
-                extracted_text=extracted_text,
                 folder_id=folder_id,
-                user_id=user_id
+                user_id=user_id,
+                use_cache=request_data.use_cache
             )
-            response_data["note_task_id"] = note_task.id
+            response_data["note_task_id"] = note_task.freeze().id
+            generation_tasks.append(note_task)
 
         if request_data.flashcards:
-            flashcard_task = generate_flashcards_task.delay(
+            flashcard_task = generate_flashcards_task.s(
                 ai_model=request_data.ai_model,
-                extracted_text=extracted_text,
                 flashcards_metadata=request_data.flashcards.dict(),
                 folder_id=folder_id,
-                user_id=user_id
+                user_id=user_id,
+                use_cache=request_data.use_cache
             )
-            response_data["task_id"] = flashcard_task.id
+            response_data["task_id"] = flashcard_task.freeze().id
+            generation_tasks.append(flashcard_task)
 
         if request_data.test:
-            test_task = generate_test_task.delay(
+            test_task = generate_test_task.s(
                 ai_model=request_data.ai_model, 
-                extracted_text=extracted_text,
                 folder_id=folder_id,
-                user_id=user_id
+                user_id=user_id,
+                use_cache=request_data.use_cache
+            )
+            response_data["test_task_id"] = test_task.freeze().id
+            generation_tasks.append(test_task)
+
+        if generation_tasks:
+            extraction_task = extract_text_task.s(
+                file_metadata=[file_meta.dict() for file_meta in request_data.file_metadata or []],
+                link=request_data.link_metadata,
+                topic=request_data.topic_metadata,
+                progress_task_ids=list(response_data.values()),
+                readers=len(generation_tasks)
             )
-            response_data["test_task_id"] = test_task.id
+            (extraction_task | group(generation_tasks)).apply_async()
 
         return response_data
     except Exception as e:
@@ -1,4 +1,7 @@
 from abc import ABC, abstractmethod
+import traceback
+import hashlib
+import json
 import os
 import demjson3
 from openai import OpenAI
@@ -6,7 +9,7 @@ from openai import OpenAI
 
 class AIManager(ABC):
     @abstractmethod
-    def get_ai_res(self, system_prompt, user_prompt, output_format_type):
+    def get_ai_res(self, system_prompt, user_prompt, output_format_type, use_cache, output_schema):
         pass
 
     @abstractmethod
@@ -30,15 +33,59 @@ def get_dict_from_text(text):
     return dictionary
 
 
+def parse_output(output_text, output_format_type):
+    if output_format_type == "JSON":
+        try:
+            return json.loads(output_text)
+        except json.JSONDecodeError:
+            # Lenient repair for output that is almost JSON, before asking the model again
+            return get_dict_from_text(output_text)
+    return output_text
+
+
 class OpenAIManager(AIManager):
-    def __init__(self, client):
+    def __init__(self, client, response_cache=None):
         self.client = client
-
-    def get_ai_res(self, system_prompt: str, user_prompt: str, output_format_type="JSON"):
+        self.response_cache = response_cache
+
+    def get_cache_key(self, system_prompt, user_prompt):
+        prompt_hash = hashlib.sha256(
+            "\0".join([self.model_name, system_prompt, user_prompt]).encode("utf-8")
+        ).hexdigest()
+        return self.response_cache.get_key(self.model_name, prompt_hash)
+
+    def get_cached_res(self, cache_key, output_format_type):
+        try:
+            output_text = self.response_cache.get(cache_key)
+            if output_text is not None:
+                return parse_output(output_text, output_format_type)
+        except Exception:
+            # Unreadable entries are regenerated and overwritten
+            traceback.print_exc()
+
+    def cache_res(self, cache_key, output_text, request_cost):
+        try:
+            self.response_cache.set(cache_key, output_text)
+            self.response_cache.client.hincrbyfloat(self.response_cache.stats_key, "miss_cost", request_cost)
+        except Exception:
+            traceback.print_exc()
+
+    def get_ai_res(self, system_prompt: str, user_prompt: str, output_format_type="JSON", use_cache=True, output_schema=None):
+        use_cache = use_cache and self.response_cache is not None
+        if use_cache:
+            cache_key = self.get_cache_key(system_prompt, user_prompt)
+            data = self.get_cached_res(cache_key, output_format_type)
+            if data is not None:
+                # Only calls that reach the model cost anything
+                return data, 0
+
+        # Schema-constrained output parses as plain JSON
+        text_format = {"text": {"format": output_schema}} if output_schema else {}
         for _ in range(2):
             try:
                 response = self.client.responses.create(
                     model=self.model_name,
+                    **text_format,
                     input=[
                         {
                             "role": "developer",
@@ -53,10 +100,10 @@ class OpenAIManager(AIManager):
                 print("Output text:", response.output_text)
                 request_cost = self.get_request_cost(response)
                 print("request_cost", request_cost)
-                if output_format_type == "JSON":
-                    data = get_dict_from_text(response.output_text), request_cost
-                else:
-                    data = response.output_text, request_cost
+                data = parse_output(response.output_text, output_format_type), request_cost
+                # Stored once parsed, so malformed outputs are not served again
+                if use_cache:
+                    self.cache_res(cache_key, response.output_text, request_cost)
                 return data
             except Exception as e:
                 print("Error in ai manager:", str(e))
@@ -91,25 +138,29 @@ class OpenAIManager(AIManager):
 
 
 class GPT41Nano(OpenAIManager):
-    def __init__(self, client):
+    def __init__(self, client, response_cache=None):
         self.model_name = "gpt-4.1-nano"
         self.input_token_cost = 0.100 / 1000000 # $0.100 / 1M tokens
         self.output_token_cost = 0.025 / 1000000 # $0.025 / 1M tokens
         self.cached_token_cost = 0.400 / 1000000 # $0.400 / 1M tokens
-        super().__init__(client)
+        super().__init__(client, response_cache)
 
 
 class GPT5Mini(OpenAIManager):
-    def __init__(self, client):
+    def __init__(self, client, response_cache=None):
         self.model_name = "gpt-5-mini"
-        super().__init__(client)
+        self.input_token_cost = 0.250 / 1000000 # $0.250 / 1M tokens
+        self.output_token_cost = 2.000 / 1000000 # $2.000 / 1M tokens
+        self.cached_token_cost = 0.025 / 1000000 # $0.025 / 1M tokens
+        super().__init__(client, response_cache)
 
 
 class AIFactory:
-    def __init__(self):
+    def __init__(self, response_cache=None):
         self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.response_cache = response_cache
 
     def get_ai(self, model=None):
         # if model == "gpt-4.1-nano":
-        #     return GPT41Nano(self.openai_client)
-        return GPT5Mini(self.openai_client)
\ No newline at end of file
+        #     return GPT41Nano(self.openai_client, self.response_cache)
+        return GPT5Mini(self.openai_client, self.response_cache)
\ No newline at end of file
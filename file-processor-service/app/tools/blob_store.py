@@ -0,0 +1,58 @@
+import hashlib
+import tempfile
+import os
+
+
+FILES_DIR = "files"
+BLOBS_DIR = os.path.join(FILES_DIR, "blobs")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def get_blob_path(content_hash):
+    return os.path.join(BLOBS_DIR, content_hash)
+
+
+def write_stream(src, out_file, sha256, chunk_size=UPLOAD_CHUNK_SIZE):
+    for chunk in iter(lambda: src.read(chunk_size), b""):
+        sha256.update(chunk)
+        out_file.write(chunk)
+
+
+def link_blob(temp_path, content_hash, file_path):
+    """Link a file name to the blob of its content, making the written temp file the blob if it is new.
+
+    Every file name is a hard link to its blob, so the blob's link count is its reference count.
+    """
+    os.makedirs(BLOBS_DIR, exist_ok=True)
+    blob_path = get_blob_path(content_hash)
+    while True:
+        try:
+            os.link(temp_path, blob_path)
+        except FileExistsError:
+            pass
+        try:
+            os.link(blob_path, file_path)
+            return
+        except FileNotFoundError:
+            # The blob lost its last reference between the two links, so store it again
+            continue
+
+
+def store_file(src, file_name):
+    """Stream src into the blob store under file_name and return the SHA-256 of its content."""
+    os.makedirs(BLOBS_DIR, exist_ok=True)
+    sha256 = hashlib.sha256()
+    # Written beside the blobs so the links stay on one filesystem
+    with tempfile.NamedTemporaryFile(dir=BLOBS_DIR, prefix=".upload-", delete=False) as out_file:
+        temp_path = out_file.name
+        try:
+            write_stream(src, out_file, sha256)
+        except Exception:
+            os.remove(temp_path)
+            raise
+    try:
+        content_hash = sha256.hexdigest()
+        link_blob(temp_path, content_hash, os.path.join(FILES_DIR, file_name))
+        return content_hash
+    finally:
+        os.remove(temp_path)
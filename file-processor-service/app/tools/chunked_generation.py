@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+
+from .text_chunker import split_text
+
+
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", 4))
+
+FLASHCARD_KEY_FIELDS = {
+    "basic_flashcards": "front",
+    "cloze_flashcards": "text",
+    "list_flashcards": "question"
+}
+
+
+def generate_per_chunk(ai, get_system_prompt, extracted_text, use_cache=True, output_schema=None):
+    """Run the prompt over each chunk of the text in parallel and return the parsed results in order.
+
+    get_system_prompt gets the number of chunks, so per-document limits can be shared out.
+    """
+    chunks = split_text(extracted_text)
+    system_prompt = get_system_prompt(len(chunks))
+    with ThreadPoolExecutor(max_workers=min(GENERATION_CONCURRENCY, len(chunks))) as executor:
+        results = list(executor.map(
+            lambda chunk: ai.get_ai_res(
+                system_prompt=system_prompt,
+                user_prompt=chunk,
+                use_cache=use_cache,
+                output_schema=output_schema
+            ),
+            chunks
+        ))
+
+    # get_ai_res gives None once its retries are spent; the other chunks are still used
+    results = [result for result in results if result]
+    if not results:
+        raise RuntimeError("The generation failed for every chunk")
+    print("Generation cost:", sum(cost or 0 for _, cost in results))
+    return [data for data, _ in results]
+
+
+def get_chunk_amount(amount, chunks_num):
+    return math.ceil(amount / chunks_num) if amount else None
+
+
+def normalize_key(value):
+    return " ".join(str(value).lower().split())
+
+
+def dedupe(items, key_field):
+    seen = set()
+    unique_items = []
+    for item in items:
+        # A malformed item is dropped on its own instead of failing the chunk
+        if not isinstance(item, dict) or not item.get(key_field):
+            continue
+        key = normalize_key(item.get(key_field))
+        if key in seen:
+            continue
+        seen.add(key)
+        unique_items.append(item)
+    return unique_items
+
+
+def share_amount(counts, amount):
+    """Split amount evenly between the types, handing on what a type cannot fill to the others."""
+    quotas = {key: 0 for key in counts}
+    active = [key for key in counts if counts[key] > 0]
+    remaining = amount
+    while remaining > 0 and active:
+        share = max(1, remaining // len(active))
+        for key in list(active):
+            if remaining == 0:
+                break
+            taken = min(share, counts[key] - quotas[key], remaining)
+            quotas[key] += taken
+            remaining -= taken
+            if quotas[key] == counts[key]:
+                active.remove(key)
+    return quotas
+
+
+def merge_flashcards(partial_decks, amount=None):
+    flashcards = {"deck_name": partial_decks[0].get("deck_name")}
+    for flashcards_type, key_field in FLASHCARD_KEY_FIELDS.items():
+        items = [item for deck in partial_decks for item in deck.get(flashcards_type) or []]
+        if items:
+            flashcards[flashcards_type] = dedupe(items, key_field)
+
+    if amount:
+        # Chunks are asked for their share rounded up, so trim the overshoot. The prompt asks
+        # for the requested types alike, so each keeps an even part of the amount
+        quotas = share_amount(
+            {key: len(value) for key, value in flashcards.items() if key in FLASHCARD_KEY_FIELDS},
+            amount
+        )
+        for flashcards_type, quota in quotas.items():
+            flashcards[flashcards_type] = flashcards[flashcards_type][:quota]
+    return flashcards
+
+
+def merge_tests(partial_tests):
+    items = [item for test in partial_tests for item in test.get("multiple_choice_test_items") or []]
+    return {
+        "test_name": partial_tests[0].get("test_name"),
+        "multiple_choice_test_items": dedupe(items, "question")
+    }
+
+
+def merge_notes(partial_notes):
+    # Each chunk's note keeps its sections, in the order of the source
+    return {
+        "note_name": partial_notes[0].get("note_name"),
+        "note_content": "<hr/>".join(
+            note.get("note_content") for note in partial_notes if note.get("note_content")
+        )
+    }
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+import hashlib
+import shutil
+import fcntl
+import json
+import time
+import os
+
+from .blob_store import FILES_DIR, link_blob, get_blob_path
+
+
+UPLOADS_DIR = os.path.join(FILES_DIR, "uploads")
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", 8 * 1024 * 1024))
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", 2 * 1024 * 1024 * 1024))
+UPLOAD_EXPIRY = int(os.getenv("UPLOAD_EXPIRY", 24 * 3600))
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChunkedUpload:
+    """A file uploaded in fixed-size parts, each written at its offset in one preallocated file.
+
+    Received parts are recorded as empty marker files, so an interrupted upload can be resumed
+    by sending only the parts that are missing.
+    """
+    def __init__(self, upload_id):
+        self.upload_id = upload_id
+        self.dir = os.path.join(UPLOADS_DIR, upload_id)
+        self.data_path = os.path.join(self.dir, "data")
+        self.parts_dir = os.path.join(self.dir, "parts")
+        self.completed_path = os.path.join(self.dir, "completed")
+        with open(os.path.join(self.dir, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    @classmethod
+    def create(cls, upload_id, meta):
+        if meta["size"] <= 0:
+            raise UploadError("File size must be positive")
+        if meta["size"] > UPLOAD_MAX_SIZE:
+            raise UploadError(f"Files are limited to {UPLOAD_MAX_SIZE} bytes")
+        upload_dir = os.path.join(UPLOADS_DIR, upload_id)
+        os.makedirs(os.path.join(upload_dir, "parts"))
+        meta = {**meta, "part_size": UPLOAD_PART_SIZE, "created_at": time.time()}
+        with open(os.path.join(upload_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        with open(os.path.join(upload_dir, "data"), "wb") as f:
+            f.truncate(meta["size"])
+        return cls(upload_id)
+
+    @property
+    def parts_num(self):
+        return max(1, -(-self.meta["size"] // self.meta["part_size"]))
+
+    def get_part_length(self, part_index):
+        if part_index == self.parts_num - 1:
+            return self.meta["size"] - part_index * self.meta["part_size"]
+        return self.meta["part_size"]
+
+    def get_received_parts(self):
+        return sorted(int(name) for name in os.listdir(self.parts_dir))
+
+    @contextmanager
+    def lock(self, exclusive=False):
+        # Parts are written under a shared lock, so completing waits for the ones in flight
+        fd = os.open(os.path.join(self.dir, "lock"), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def is_completed(self):
+        return os.path.exists(self.completed_path)
+
+    def write_part(self, part_index, data, sha256_hex):
+        if not 0 <= part_index < self.parts_num:
+            raise UploadError("Part index out of range")
+        if len(data) != self.get_part_length(part_index):
+            raise UploadError("Part has the wrong length")
+        if hashlib.sha256(data).hexdigest() != sha256_hex.lower():
+            raise UploadError("Part checksum mismatch")
+
+        with self.lock():
+            # The data becomes a blob on completion, which must never change after
+            if self.is_completed():
+                raise UploadError("Upload is already completed")
+            fd = os.open(self.data_path, os.O_WRONLY)
+            try:
+                os.pwrite(fd, data, part_index * self.meta["part_size"])
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            # Marked only once the bytes are on disk, so a crash never skips a part on resume
+            open(os.path.join(self.parts_dir, str(part_index)), "w").close()
+
+    def complete(self, file_name):
+        """Link the assembled file into the blob store under file_name and return its SHA-256.
+
+        The upload is kept until the caller deletes it, so completing can be retried if the
+        file cannot be registered.
+        """
+        with self.lock(exclusive=True):
+            missing = set(range(self.parts_num)) - set(self.get_received_parts())
+            if missing:
+                raise UploadError(f"Missing parts: {sorted(missing)}")
+            # No part is accepted from here on, so the data is final before it is hashed
+            open(self.completed_path, "w").close()
+            os.chmod(self.data_path, 0o444)
+
+        sha256 = hashlib.sha256()
+        with open(self.data_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        content_hash = sha256.hexdigest()
+        if self.meta.get("sha256") and self.meta["sha256"].lower() != content_hash:
+            # Reopened, so the client can send the bad parts again
+            with self.lock(exclusive=True):
+                os.chmod(self.data_path, 0o644)
+                os.remove(self.completed_path)
+            raise UploadError("File checksum mismatch")
+
+        link_blob(self.data_path, content_hash, os.path.join(FILES_DIR, file_name))
+        return content_hash
+
+    def unlink_file(self, file_name, content_hash):
+        """Undo complete, removing the blob too if it was made from this upload alone."""
+        file_path = os.path.join(FILES_DIR, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        blob_path = get_blob_path(content_hash)
+        # Only the blob and the upload's data are left, so no stored file uses it
+        if (
+            os.path.exists(blob_path)
+            and os.path.samefile(blob_path, self.data_path)
+            and os.stat(blob_path).st_nlink == 2
+        ):
+            os.remove(blob_path)
+
+    def delete(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def remove_expired_uploads():
+    if not os.path.isdir(UPLOADS_DIR):
+        return
+    for upload_id in os.listdir(UPLOADS_DIR):
+        upload_dir = os.path.join(UPLOADS_DIR, upload_id)
+        try:
+            # The parts directory changes with every received part
+            last_activity = os.path.getmtime(os.path.join(upload_dir, "parts"))
+        except OSError:
+            last_activity = os.path.getmtime(upload_dir)
+        if time.time() - last_activity > UPLOAD_EXPIRY:
+            shutil.rmtree(upload_dir, ignore_errors=True)
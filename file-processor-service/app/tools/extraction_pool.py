@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+import multiprocessing
+import threading
+import atexit
+import time
+import os
+
+
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", os.cpu_count() or 1))
+
+
+class ExtractionPool:
+    """A process pool kept for the worker's lifetime and shared by its threads.
+
+    A task stuck past its timeout can only be stopped by terminating its pool, so that pool is
+    retired instead: later extractions get a new one, and the old one is terminated once the
+    extractions still using it are done.
+    """
+    def __init__(self, processes=EXTRACTION_PROCESSES):
+        self.processes = processes
+        self._pool = None
+        self._users = {} # pool -> extractions using it
+        self._jobs = {} # pool -> files queued or running on it, from every thread
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned, since the extraction worker runs its tasks on threads
+                self._pool = multiprocessing.get_context("spawn").Pool(self.processes)
+                self._users[self._pool] = 0
+            pool = self._pool
+            self._users[pool] += 1
+        try:
+            yield pool
+        finally:
+            with self._lock:
+                self._users[pool] -= 1
+                if pool is not self._pool and not self._users[pool]:
+                    del self._users[pool]
+                    self._jobs.pop(pool, None)
+                    pool.terminate()
+
+    def submit(self, pool, func, args, timeout):
+        """Queue func on the pool and return its result with the time by which it has to be done.
+
+        Each job ahead in the queue may take up to the timeout itself, so the deadline leaves
+        room for the rounds before this one, whichever thread queued them.
+        """
+        with self._lock:
+            ahead = self._jobs.get(pool, 0)
+            self._jobs[pool] = ahead + 1
+        deadline = time.monotonic() + timeout * (ahead // self.processes + 1)
+        on_done = lambda _: self._finish_job(pool)
+        return pool.apply_async(func, args, callback=on_done, error_callback=on_done), deadline
+
+    def _finish_job(self, pool):
+        with self._lock:
+            if pool in self._jobs:
+                self._jobs[pool] -= 1
+
+    def retire(self, pool):
+        with self._lock:
+            if pool is self._pool:
+                self._pool = None
+
+    def close(self):
+        with self._lock:
+            for pool in self._users:
+                pool.terminate()
+            self._users.clear()
+            self._jobs.clear()
+            self._pool = None
+
+
+extraction_pool = ExtractionPool()
+atexit.register(extraction_pool.close)
@@ -0,0 +1,18 @@
+from functools import lru_cache
+import hashlib
+import os
+
+
+@lru_cache(maxsize=4096)
+def _file_hash(path, mtime_ns, size):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def file_hash(path):
+    # Keyed on mtime and size too, so a rewritten file is hashed again
+    stat = os.stat(path)
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,165 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from queue import Queue
+import threading
+import tempfile
+import subprocess
+import shutil
+import signal
+import socket
+import atexit
+import time
+import os
+
+import psutil
+from unoserver.client import UnoClient
+
+
+LIBREOFFICE_WORKERS = int(os.getenv("LIBREOFFICE_WORKERS", os.cpu_count() or 1))
+LIBREOFFICE_QUEUE_SIZE = int(os.getenv("LIBREOFFICE_QUEUE_SIZE", 32))
+LIBREOFFICE_TIMEOUT = float(os.getenv("LIBREOFFICE_TIMEOUT", 120))
+LIBREOFFICE_MAX_CONVERSIONS = int(os.getenv("LIBREOFFICE_MAX_CONVERSIONS", 200))
+LIBREOFFICE_MAX_MEMORY_MB = int(os.getenv("LIBREOFFICE_MAX_MEMORY_MB", 1024))
+# unoserver has to run on a Python that can import uno, which is the system one
+UNOSERVER_COMMAND = os.getenv("UNOSERVER_COMMAND", "/usr/bin/python3 -m unoserver.server").split()
+
+
+class ConversionError(Exception):
+    pass
+
+
+class PoolBusyError(ConversionError):
+    pass
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LibreOfficeWorker:
+    def __init__(self, index):
+        self.port = None
+        self.uno_port = None
+        # A profile per instance and per process, since every uvicorn or celery process builds its own pool
+        self.profile_dir = os.path.join(tempfile.gettempdir(), f"libreoffice-worker-{os.getpid()}-{index}")
+        self.process = None
+        self.conversions = 0
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, startup_timeout=60):
+        # Free ports are picked on each start, so pools in other processes never collide
+        self.port = get_free_port()
+        self.uno_port = get_free_port()
+        self.process = subprocess.Popen(
+            UNOSERVER_COMMAND + [
+                "--interface", "127.0.0.1",
+                "--port", str(self.port),
+                "--uno-port", str(self.uno_port),
+                "--user-installation", "file://" + self.profile_dir
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        self.conversions = 0
+
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise ConversionError("LibreOffice worker exited on startup")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.5)
+        self.stop()
+        raise ConversionError("LibreOffice worker did not start in time")
+
+    def stop(self):
+        if self.process is None:
+            return
+        # soffice is a child of unoserver, so the whole group goes
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        self.process = None
+
+    def memory_mb(self):
+        try:
+            process = psutil.Process(self.process.pid)
+            processes = [process, *process.children(recursive=True)]
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except psutil.Error:
+            return 0
+
+    def convert(self, input_path, output_path):
+        client = UnoClient(server="127.0.0.1", port=str(self.port), host_location="local")
+        client.convert(inpath=input_path, outpath=output_path, convert_to="pdf")
+
+
+class LibreOfficePool:
+    def __init__(
+        self,
+        workers=LIBREOFFICE_WORKERS,
+        queue_size=LIBREOFFICE_QUEUE_SIZE,
+        timeout=LIBREOFFICE_TIMEOUT,
+        max_conversions=LIBREOFFICE_MAX_CONVERSIONS,
+        max_memory_mb=LIBREOFFICE_MAX_MEMORY_MB
+    ):
+        self.timeout = timeout
+        self.max_conversions = max_conversions
+        self.max_memory_mb = max_memory_mb
+        self._workers = [LibreOfficeWorker(index) for index in range(workers)]
+        self._idle = Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        # Jobs running plus jobs waiting for a worker
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def convert(self, input_path, output_path):
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusyError("Too many conversions queued")
+        try:
+            worker = self._idle.get()
+            try:
+                self._run(worker, input_path, output_path)
+            finally:
+                self._idle.put(worker)
+        finally:
+            self._slots.release()
+
+    def _run(self, worker, input_path, output_path):
+        # Workers are started on first use, so importing the pool costs nothing
+        if not worker.is_running():
+            worker.start()
+
+        future = self._executor.submit(worker.convert, os.path.abspath(input_path), os.path.abspath(output_path))
+        try:
+            future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Killing the instance also unblocks the hung call
+            worker.stop()
+            raise ConversionError(f"Conversion timed out after {self.timeout}s")
+        except Exception as e:
+            worker.stop()
+            raise ConversionError(str(e))
+
+        worker.conversions += 1
+        if worker.conversions >= self.max_conversions or worker.memory_mb() > self.max_memory_mb:
+            worker.stop()
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+            shutil.rmtree(worker.profile_dir, ignore_errors=True)
+        self._executor.shutdown(wait=False)
+
+
+libreoffice_pool = LibreOfficePool()
+atexit.register(libreoffice_pool.close)
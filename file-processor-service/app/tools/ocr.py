@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import tempfile
+import os
+
+import pypdfium2
+import pytesseract
+from PIL import Image, ImageSequence
+
+from .extraction_pool import EXTRACTION_PROCESSES
+
+
+# OCR runs inside each of the extraction processes, so they split the cores between them
+OCR_THREADS = int(os.getenv("OCR_THREADS", max(1, (os.cpu_count() or 1) // EXTRACTION_PROCESSES)))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", 50))
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", 20))
+OCR_RENDER_SCALE = float(os.getenv("OCR_RENDER_SCALE", 300 / 72)) # 300 DPI
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "eng")
+
+# One tesseract process per page already fills a core
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def ocr_image(image_path):
+    return pytesseract.image_to_string(image_path, lang=OCR_LANGUAGES)
+
+
+class OCRJob:
+    """OCRs page images on a thread pool, since each page runs in its own tesseract process."""
+    def __init__(self, pages_total, on_progress=None):
+        self.pages_total = pages_total
+        self.pages_done = 0
+        self.on_progress = on_progress
+        self._executor = ThreadPoolExecutor(max_workers=OCR_THREADS)
+        self._futures = {}
+        self._lock = Lock()
+
+    def submit(self, page_index, image_path):
+        future = self._executor.submit(ocr_image, image_path)
+        future.add_done_callback(self._page_done)
+        self._futures[page_index] = future
+
+    def _page_done(self, _):
+        with self._lock:
+            self.pages_done += 1
+            if self.on_progress:
+                self.on_progress({"pages_done": self.pages_done, "pages_total": self.pages_total})
+
+    def results(self):
+        try:
+            return {page_index: future.result() for page_index, future in self._futures.items()}
+        finally:
+            self._executor.shutdown()
+
+
+def extract_pdf_text(filename, on_progress=None):
+    """Use the text layer where there is one and OCR only the pages without it."""
+    pdf = pypdfium2.PdfDocument(filename)
+    try:
+        pages_text = []
+        for page in pdf:
+            text_page = page.get_textpage()
+            pages_text.append(text_page.get_text_range())
+            text_page.close()
+            page.close()
+
+        scanned_pages = [
+            page_index for page_index, text in enumerate(pages_text)
+            if len(text.strip()) < OCR_MIN_PAGE_CHARS
+        ][:OCR_MAX_PAGES]
+        if not scanned_pages:
+            return "\n".join(pages_text)
+
+        job = OCRJob(len(scanned_pages), on_progress)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # pdfium is not thread-safe, so pages are rendered here and only OCR is parallel
+            for page_index in scanned_pages:
+                page = pdf[page_index]
+                image_path = os.path.join(tmp_dir, f"{page_index}.png")
+                page.render(scale=OCR_RENDER_SCALE).to_pil().save(image_path)
+                page.close()
+                job.submit(page_index, image_path)
+            for page_index, text in job.results().items():
+                pages_text[page_index] = text
+        return "\n".join(pages_text)
+    finally:
+        pdf.close()
+
+
+def extract_image_text(filename, on_progress=None):
+    with Image.open(filename) as image:
+        frames_num = getattr(image, "n_frames", 1)
+        if frames_num == 1:
+            return ocr_image(filename)
+
+        # Multi-page TIFFs and animated GIFs are OCRed frame by frame
+        frames_num = min(frames_num, OCR_MAX_PAGES)
+        job = OCRJob(frames_num, on_progress)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for frame_index, frame in enumerate(ImageSequence.Iterator(image)):
+                if frame_index >= frames_num:
+                    break
+                image_path = os.path.join(tmp_dir, f"{frame_index}.png")
+                frame.convert("RGB").save(image_path)
+                job.submit(frame_index, image_path)
+            pages_text = job.results()
+        return "\n".join(pages_text[frame_index] for frame_index in range(frames_num))
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import os
+
+from .file_hash import file_hash
+from .libreoffice_pool import (
+    libreoffice_pool, ConversionError, PoolBusyError, LIBREOFFICE_WORKERS, LIBREOFFICE_QUEUE_SIZE
+)
+
+
+RENDITIONS_DIR = os.path.join("files", "renditions")
+RENDITION_HASH_THREADS = int(os.getenv("RENDITION_HASH_THREADS", 4))
+CONVERTIBLE_EXTENSIONS = {
+    "doc", "docx", "odt", "rtf", "ppt", "pptx", "odp", "xls", "xlsx", "ods"
+}
+
+
+def get_rendition_path(content_hash):
+    return os.path.join(RENDITIONS_DIR, f"{content_hash}.pdf")
+
+
+def convert_to_pdf(input_path, output_path):
+    os.makedirs(RENDITIONS_DIR, exist_ok=True)
+    # Written beside the store first so the final rename is atomic
+    partial_path = output_path + f".{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        libreoffice_pool.convert(input_path, partial_path)
+        if not os.path.exists(partial_path):
+            raise ConversionError("No PDF was produced")
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+# Conversions wait in the event loop for a slot and only then take a thread, so a burst of them
+# never ties up the threads that hashing (and with it every cached view) needs
+_conversion_slots = asyncio.Semaphore(LIBREOFFICE_WORKERS + LIBREOFFICE_QUEUE_SIZE)
+_conversion_executor = ThreadPoolExecutor(
+    max_workers=LIBREOFFICE_WORKERS + LIBREOFFICE_QUEUE_SIZE, thread_name_prefix="pdf-conversion"
+)
+_hash_executor = ThreadPoolExecutor(max_workers=RENDITION_HASH_THREADS, thread_name_prefix="rendition-hash")
+_pending_conversions = {} # content_hash -> asyncio.Task
+
+
+async def run_conversion(input_path, output_path):
+    async with _conversion_slots:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_conversion_executor, convert_to_pdf, input_path, output_path)
+
+
+async def get_pdf_rendition(input_path):
+    """Return the path and content hash of the stored PDF rendition, converting it once if missing."""
+    content_hash = await asyncio.get_running_loop().run_in_executor(_hash_executor, file_hash, input_path)
+    output_path = get_rendition_path(content_hash)
+    if os.path.exists(output_path):
+        return output_path, content_hash
+
+    # Concurrent requests for the same content wait on the one conversion
+    task = _pending_conversions.get(content_hash)
+    if task is None:
+        if _conversion_slots.locked():
+            raise PoolBusyError("Too many conversions queued")
+        task = asyncio.create_task(run_conversion(input_path, output_path))
+        _pending_conversions[content_hash] = task
+        task.add_done_callback(lambda _: _pending_conversions.pop(content_hash, None))
+    await asyncio.shield(task)
+    return output_path, content_hash
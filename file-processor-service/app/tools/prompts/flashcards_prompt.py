@@ -1,3 +1,6 @@
+from .output_schema import get_strict_object, get_strict_output_schema
+
+
 def get_flashcards_system_prompt(
         comprehensiveness="medium", # high, medium, low
         verbosity="low", # high, medium, low
@@ -72,6 +75,27 @@ def get_flashcards_system_prompt(
     return flashcards_system_prompt
 
 
+def get_flashcards_output_schema(flashcard_types=["basic"]):
+    string = {"type": "string"}
+    strings = {"type": "array", "items": string}
+    flashcard_types_schemas = {
+        "basic": {"front": string, "back": string},
+        "cloze": {"text": string, "hidden_parts": strings},
+        "list": {"question": string, "items": strings}
+    }
+
+    properties = {}
+    for flashcard_type in flashcard_types:
+        item_properties = flashcard_types_schemas.get(flashcard_type)
+        properties[f"{flashcard_type}_flashcards"] = {
+            "type": "array",
+            "items": get_strict_object(item_properties)
+        }
+    properties["deck_name"] = string
+
+    return get_strict_output_schema("flashcards", properties)
+
+
 if __name__ == "__main__":
     print(get_flashcards_system_prompt())
 
@@ -1,3 +1,6 @@
+from .output_schema import get_strict_output_schema
+
+
 def get_notes_system_prompt():
     good_math_example1 = """
     <p>When \( a \ne 0 \), there are two solutions to \( ax^2 + bx + c = 0 \) given by:\[x = \frac{-b \pm \sqrt{b^2 - 4ac}}{2a}\]</p>
@@ -41,5 +44,12 @@ def get_notes_system_prompt():
 
     return notes_system_prompt
 
+
+def get_notes_output_schema():
+    return get_strict_output_schema("note", {
+        "note_content": {"type": "string"},
+        "note_name": {"type": "string"}
+    })
+
 if __name__ == "__main__":
     print(get_notes_system_prompt())
\ No newline at end of file
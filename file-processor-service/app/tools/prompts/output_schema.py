@@ -0,0 +1,18 @@
+def get_strict_object(properties):
+    # Strict mode needs every property required and no others allowed
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+def get_strict_output_schema(name, properties):
+    """The output format a prompt describes, as a strict JSON schema for structured outputs."""
+    return {
+        "type": "json_schema",
+        "name": name,
+        "strict": True,
+        "schema": get_strict_object(properties)
+    }
@@ -1,3 +1,6 @@
+from .output_schema import get_strict_object, get_strict_output_schema
+
+
 def get_test_system_prompt():
 
     output_format = """
@@ -33,4 +36,18 @@ def get_test_system_prompt():
     ###Extracted text###
     """
 
-    return tests_system_prompt
\ No newline at end of file
+    return tests_system_prompt
+
+
+def get_test_output_schema():
+    return get_strict_output_schema("test", {
+        "multiple_choice_test_items": {
+            "type": "array",
+            "items": get_strict_object({
+                "question": {"type": "string"},
+                "true_option": {"type": "string"},
+                "false_options": {"type": "array", "items": {"type": "string"}}
+            })
+        },
+        "test_name": {"type": "string"}
+    })
\ No newline at end of file
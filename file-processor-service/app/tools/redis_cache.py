@@ -0,0 +1,107 @@
+import time
+import zlib
+
+
+# Keeps the running total in step with the sizes hash, atomically with the write
+SET_SCRIPT = """
+if redis.call('EXISTS', KEYS[4]) == 0 then
+    local total = 0
+    for _, size in ipairs(redis.call('HVALS', KEYS[3])) do
+        total = total + tonumber(size)
+    end
+    redis.call('SET', KEYS[4], total)
+end
+local old_size = tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or 0)
+redis.call('SET', ARGV[1], ARGV[2], 'EX', ARGV[4])
+redis.call('HSET', KEYS[3], ARGV[1], string.len(ARGV[2]))
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[3] + ARGV[4], ARGV[1])
+return redis.call('INCRBY', KEYS[4], string.len(ARGV[2]) - old_size)
+"""
+
+REMOVE_SCRIPT = """
+for _, key in ipairs(ARGV) do
+    local size = redis.call('HGET', KEYS[3], key)
+    if size then
+        redis.call('HDEL', KEYS[3], key)
+        redis.call('DECRBY', KEYS[4], size)
+    end
+    redis.call('DEL', key)
+    redis.call('ZREM', KEYS[1], key)
+    redis.call('ZREM', KEYS[2], key)
+end
+return tonumber(redis.call('GET', KEYS[4]) or 0)
+"""
+
+
+class RedisLRUCache:
+    """Compressed text values in Redis with a TTL, a total size budget and hit/miss counters."""
+    def __init__(self, client, prefix, max_bytes, ttl):
+        self.client = client
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lru_key = prefix + "lru" # cache key -> last access time
+        self.expiry_key = prefix + "expiry" # cache key -> time its TTL runs out
+        self.sizes_key = prefix + "sizes" # cache key -> stored bytes
+        self.total_key = prefix + "total" # sum of the stored bytes
+        self.stats_key = prefix + "stats"
+        self._set_script = client.register_script(SET_SCRIPT)
+        self._remove_script = client.register_script(REMOVE_SCRIPT)
+
+    @property
+    def index_keys(self):
+        return [self.lru_key, self.expiry_key, self.sizes_key, self.total_key]
+
+    def get_key(self, *parts):
+        return self.prefix + ":".join(str(part) for part in parts)
+
+    def get(self, key):
+        data = self.client.get(key)
+        if data is None:
+            self.client.hincrby(self.stats_key, "misses", 1)
+            return None
+        pipe = self.client.pipeline()
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.hincrby(self.stats_key, "hits", 1)
+        pipe.execute()
+        return zlib.decompress(data).decode("utf-8")
+
+    def set(self, key, text):
+        data = zlib.compress(text.encode("utf-8"))
+        total = self._set_script(keys=self.index_keys, args=[key, data, time.time(), self.ttl])
+        if total > self.max_bytes:
+            self.evict()
+
+    def remove(self, keys):
+        """Delete values with their bookkeeping and return the new total size."""
+        return self._remove_script(keys=self.index_keys, args=keys)
+
+    def evict(self):
+        # Values past their TTL are already gone from Redis, so only their bookkeeping is left
+        expired = self.client.zrangebyscore(self.expiry_key, 0, time.time())
+        if expired:
+            total = self.remove(expired)
+        else:
+            total = int(self.client.get(self.total_key) or 0)
+        # Then drop the least recently used values until the total fits the budget
+        while total > self.max_bytes:
+            oldest = self.client.zrange(self.lru_key, 0, 0)
+            if not oldest:
+                break
+            total = self.remove(oldest)
+
+    def stats(self):
+        stats = {key.decode(): float(value) for key, value in self.client.hgetall(self.stats_key).items()}
+        hits = int(stats.pop("hits", 0))
+        misses = int(stats.pop("misses", 0))
+        requests_num = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / requests_num if requests_num else 0,
+            "size_bytes": int(self.client.get(self.total_key) or 0),
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            **stats
+        }
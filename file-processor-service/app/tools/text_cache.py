@@ -0,0 +1,37 @@
+import traceback
+import os
+
+from .. import redis_client
+from .file_hash import file_hash
+from .redis_cache import RedisLRUCache
+
+
+EXTRACTED_TEXT_CACHE_MAX_MB = int(os.getenv("EXTRACTED_TEXT_CACHE_MAX_MB", 512))
+EXTRACTED_TEXT_CACHE_TTL = int(os.getenv("EXTRACTED_TEXT_CACHE_TTL", 30 * 24 * 3600))
+
+extracted_text_cache = RedisLRUCache(
+    client=redis_client,
+    prefix="extracted_text:",
+    max_bytes=EXTRACTED_TEXT_CACHE_MAX_MB * 1024 * 1024,
+    ttl=EXTRACTED_TEXT_CACHE_TTL
+)
+
+
+def get_cached_text(file_path, extractor):
+    """Return the cache key of a stored file's text and the text of an earlier extraction of the same content."""
+    try:
+        key = extracted_text_cache.get_key(type(extractor).__name__, extractor.version, file_hash(file_path))
+        return key, extracted_text_cache.get(key)
+    except Exception:
+        # A cache outage only costs a fresh extraction
+        traceback.print_exc()
+        return None, None
+
+
+def cache_text(key, text):
+    if not key or not text:
+        return
+    try:
+        extracted_text_cache.set(key, text)
+    except Exception:
+        traceback.print_exc()
@@ -0,0 +1,65 @@
+from functools import lru_cache
+import re
+import os
+
+import tiktoken
+
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 12000))
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "o200k_base")
+
+SECTION_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    return tiktoken.get_encoding(CHUNK_ENCODING)
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def split_by_tokens(text, max_tokens):
+    encoding = get_encoding()
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def split_section(section, max_tokens):
+    """Break a section that is too long on its own at sentences, or at tokens as a last resort."""
+    pieces = []
+    for sentence in SENTENCE_BREAK.split(section):
+        if count_tokens(sentence) > max_tokens:
+            pieces.extend(split_by_tokens(sentence, max_tokens))
+        else:
+            pieces.append(sentence)
+    return pieces
+
+
+def split_text(text, max_tokens=CHUNK_MAX_TOKENS):
+    """Split text into chunks of at most max_tokens, cutting at section boundaries where possible."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks = []
+    chunk_parts = []
+    chunk_tokens = 0
+    for section in SECTION_BREAK.split(text):
+        section = section.strip()
+        if not section:
+            continue
+        section_tokens = count_tokens(section)
+        pieces = [section] if section_tokens <= max_tokens else split_section(section, max_tokens)
+        for piece in pieces:
+            piece_tokens = section_tokens if len(pieces) == 1 else count_tokens(piece)
+            if chunk_parts and chunk_tokens + piece_tokens > max_tokens:
+                chunks.append("\n\n".join(chunk_parts))
+                chunk_parts = []
+                chunk_tokens = 0
+            chunk_parts.append(piece)
+            chunk_tokens += piece_tokens
+    if chunk_parts:
+        chunks.append("\n\n".join(chunk_parts))
+    return chunks
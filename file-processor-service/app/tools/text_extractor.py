@@ -1,10 +1,19 @@
 from abc import ABC, abstractmethod
+import traceback
 import textract
+import docx
+import pptx
+import openpyxl
+
+from .ocr import extract_pdf_text, extract_image_text
 
 
 class TextExtractor(ABC):
+    # Bump when the output changes, so cached texts from older versions are not reused
+    version = 1
+
     @abstractmethod
-    def extract_text(self, filename: str, extension: str) -> str | None:
+    def extract_text(self, filename: str, extension: str, on_progress=None) -> str | None:
         pass
 
 class TextExtractorFactory:
@@ -34,7 +43,7 @@ def register_extractor(extensions: list):
     "rtf", "tiff", "tif", "txt", "wav", "xlsx", "xls"
 ])
 class GeneralTextExtractor(TextExtractor):
-    def extract_text(self, filename: str, extension: str):
+    def extract_text(self, filename: str, extension: str, on_progress=None):
         print("FILENAME: ", filename)
         print("EXTENSION: ", extension)
         text_bytes = textract.process(
@@ -43,4 +52,77 @@ class GeneralTextExtractor(TextExtractor):
         )
         text = text_bytes.decode('utf-8', errors='ignore').strip()
         print("TEXT FROM FILE: ", text)
-        return text
\ No newline at end of file
+        return text
+
+
+general_text_extractor = GeneralTextExtractor()
+
+
+class NativeTextExtractor(TextExtractor):
+    """Parses the file in-process and falls back to textract when that fails or finds no text."""
+    def extract_text(self, filename: str, extension: str, on_progress=None):
+        try:
+            text = self.extract_native_text(filename, on_progress).strip()
+            if text:
+                return text
+        except Exception:
+            traceback.print_exc()
+        return general_text_extractor.extract_text(filename, extension)
+
+    @abstractmethod
+    def extract_native_text(self, filename: str, on_progress=None) -> str:
+        pass
+
+
+@register_extractor(["pdf"])
+class PDFTextExtractor(NativeTextExtractor):
+    version = 2
+
+    def extract_native_text(self, filename: str, on_progress=None):
+        return extract_pdf_text(filename, on_progress)
+
+
+@register_extractor(["png", "jpg", "jpeg", "gif", "tiff", "tif"])
+class ImageTextExtractor(NativeTextExtractor):
+    def extract_native_text(self, filename: str, on_progress=None):
+        return extract_image_text(filename, on_progress)
+
+
+@register_extractor(["docx"])
+class DocxTextExtractor(NativeTextExtractor):
+    def extract_native_text(self, filename: str, on_progress=None):
+        document = docx.Document(filename)
+        lines = [paragraph.text for paragraph in document.paragraphs]
+        for table in document.tables:
+            for row in table.rows:
+                lines.append("\t".join(cell.text for cell in row.cells))
+        return "\n".join(lines)
+
+
+@register_extractor(["pptx"])
+class PptxTextExtractor(NativeTextExtractor):
+    def extract_native_text(self, filename: str, on_progress=None):
+        presentation = pptx.Presentation(filename)
+        lines = []
+        for slide in presentation.slides:
+            for shape in slide.shapes:
+                if shape.has_text_frame:
+                    lines.append(shape.text_frame.text)
+        return "\n".join(lines)
+
+
+@register_extractor(["xlsx"])
+class XlsxTextExtractor(NativeTextExtractor):
+    def extract_native_text(self, filename: str, on_progress=None):
+        workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+        try:
+            lines = []
+            for sheet in workbook.worksheets:
+                lines.append(sheet.title)
+                for row in sheet.iter_rows(values_only=True):
+                    values = [str(value) for value in row if value is not None]
+                    if values:
+                        lines.append("\t".join(values))
+            return "\n".join(lines)
+        finally:
+            workbook.close()
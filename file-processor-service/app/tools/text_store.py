@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+import uuid
+import os
+
+from .. import redis_client
+
+
+SHARED_TEXT_TTL = int(os.getenv("SHARED_TEXT_TTL", 24 * 3600))
+
+KEY_PREFIX = "shared_text:"
+
+
+def store_text(text, readers):
+    """Keep the text once in Redis for the given number of readers and return its reference."""
+    if not text or not readers:
+        return None
+    text_ref = KEY_PREFIX + str(uuid.uuid4())
+    pipe = redis_client.pipeline()
+    # The TTL frees texts whose readers never run
+    pipe.set(text_ref, text.encode("utf-8"), ex=SHARED_TEXT_TTL)
+    pipe.set(text_ref + ":readers", readers, ex=SHARED_TEXT_TTL)
+    pipe.execute()
+    return text_ref
+
+
+def release_text(text_ref):
+    if redis_client.decr(text_ref + ":readers") <= 0:
+        redis_client.delete(text_ref, text_ref + ":readers")
+
+
+@contextmanager
+def shared_text(text_ref):
+    """Load a stored text and release this reader's hold on it when done."""
+    try:
+        data = redis_client.get(text_ref) if text_ref else None
+        # Fails the generation task, so its status poll ends instead of waiting on a result
+        if not data:
+            raise ValueError("Could not extract text!")
+        yield data.decode("utf-8")
+    finally:
+        if text_ref:
+            release_text(text_ref)
@@ -2,10 +2,19 @@ from fastapi import FastAPI
 from pymongo import MongoClient
 import os
 
+from .tools.service_client import ServiceClient
+
 
 client = MongoClient(f"mongodb://{os.getenv('MONGODB_HOST')}")
 db = client["fsrs_db"]
 
+CONTENT_MANAGEMENT_SERVICE = os.getenv("CONTENT_MANAGEMENT_SERVICE")
+SCHEDULER_SERVICE = os.getenv("SCHEDULER_SERVICE")
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN")
+# The review log endpoints only answer requests carrying the shared service token
+content_client = ServiceClient(CONTENT_MANAGEMENT_SERVICE, headers={"X-Service-Token": SERVICE_TOKEN or ""})
+scheduler_client = ServiceClient(SCHEDULER_SERVICE)
+
 def create_app():
     app = FastAPI()
 
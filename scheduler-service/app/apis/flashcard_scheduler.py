@@ -4,10 +4,14 @@ import traceback
 from bson import json_util
 import json
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Union
+from datetime import datetime
 
 from .. import db
-from ..tools.flashcard_scheduler import schedule_flashcard_fsrs, get_ratings_times
+from ..tools.flashcard_scheduler import (
+    schedule_flashcard_fsrs, schedule_flashcards_fsrs, get_ratings_times, load_scheduler
+)
+from ..tools.scheduler_cache import scheduler_cache
 from ..tools.claims_extractor import get_user_id_from_jwt
 
 
@@ -20,6 +24,16 @@ def mongo_row2dict(mongo_result):
     return d
 
 
+def load_user_scheduler(user_id):
+    schedulers_collection = db["schedulers_collection"]
+    scheduler = schedulers_collection.find_one({"user_id": user_id})
+    if scheduler: scheduler = mongo_row2dict(scheduler)
+    return load_scheduler(scheduler)
+
+def get_user_scheduler(user_id):
+    return scheduler_cache.get(user_id, load_user_scheduler)
+
+
 class ScheduleFlashcard(BaseModel):
     card: Optional[dict] = None
     rating: int
@@ -28,10 +42,8 @@ class ScheduleFlashcard(BaseModel):
 @flashcard_scheduler.post("/schedule-flashcard")
 async def schedule_flashcard(request_data: ScheduleFlashcard):
     try:
-        # Get the card
-        schedulers_collection = db["schedulers_collection"]
-        scheduler = schedulers_collection.find_one({"user_id": request_data.user_id})
-        if scheduler: scheduler = mongo_row2dict(scheduler)
+        # Get the user's scheduler
+        scheduler = get_user_scheduler(request_data.user_id)
 
         # Get and save the new card and the review log
         new_card, review_log = schedule_flashcard_fsrs(
@@ -39,7 +51,40 @@ async def schedule_flashcard(request_data: ScheduleFlashcard):
         )
         return JSONResponse(content={
             "new_card": new_card,
-            "review_log": review_log
+            "review_log": review_log,
+            "ratings_times": get_ratings_times(new_card, scheduler)
+        })
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class ScheduleFlashcardsReview(BaseModel):
+    card_id: Optional[Union[int, str]] = None
+    card: Optional[dict] = None
+    rating: int
+    review_datetime: Optional[datetime] = None
+
+class ScheduleFlashcards(BaseModel):
+    user_id: str
+    reviews: List[ScheduleFlashcardsReview]
+
+@flashcard_scheduler.post("/schedule-flashcards")
+async def schedule_flashcards(request_data: ScheduleFlashcards):
+    try:
+        # Load the user's scheduler once for the whole batch
+        scheduler = get_user_scheduler(request_data.user_id)
+
+        results = schedule_flashcards_fsrs(
+            [review.model_dump() for review in request_data.reviews], scheduler
+        )
+        return JSONResponse(content={
+            "results": [
+                {
+                    "new_card": new_card,
+                    "review_log": review_log
+                } for new_card, review_log in results
+            ]
         })
     except Exception as e:
         traceback.print_exc()
@@ -55,10 +100,38 @@ async def ratings_times(
     user_id: str = Depends(get_user_id_from_jwt)
 ):
     try:
-        schedulers_collection = db["schedulers_collection"]
-        scheduler = schedulers_collection.find_one({"user_id": user_id})
-        if scheduler: scheduler = mongo_row2dict(scheduler)
+        scheduler = get_user_scheduler(user_id)
         return JSONResponse(content=get_ratings_times(req_data.card, scheduler))
     except Exception as e:
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class RatingsTimesBatchReq(BaseModel):
+    user_id: str
+    cards: List[Optional[dict]]
+
+@flashcard_scheduler.post("/ratings-times-batch")
+async def ratings_times_batch(req_data: RatingsTimesBatchReq):
+    try:
+        scheduler = get_user_scheduler(req_data.user_id)
+        return JSONResponse(content={
+            "ratings_times": [get_ratings_times(card, scheduler) for card in req_data.cards]
+        })
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class InvalidateSchedulerReq(BaseModel):
+    user_id: str
+
+@flashcard_scheduler.post("/invalidate-scheduler")
+async def invalidate_scheduler(req_data: InvalidateSchedulerReq):
+    scheduler_cache.invalidate(req_data.user_id)
+    return JSONResponse(content={"msg": "Scheduler invalidated!"})
+
+
+@flashcard_scheduler.get("/scheduler-cache-stats")
+async def scheduler_cache_stats():
+    return JSONResponse(content=scheduler_cache.stats())
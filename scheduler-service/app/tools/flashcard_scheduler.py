@@ -1,6 +1,5 @@
-from fsrs import Scheduler, Card, Rating
+from fsrs import Scheduler, Card, Rating, Optimizer
 from datetime import datetime, timezone
-import copy
 
 rating_map = {
     1: Rating.Again,
@@ -9,6 +8,12 @@ rating_map = {
     4: Rating.Easy
 }
 
+def load_scheduler(scheduler):
+    if scheduler:
+        return Scheduler.from_dict(scheduler)
+    return Scheduler()
+
+
 def schedule_flashcard_fsrs(card, scheduler, rating):
     timestamp = datetime.now(timezone.utc)
 
@@ -17,17 +22,41 @@ def schedule_flashcard_fsrs(card, scheduler, rating):
     else:
         card = Card()
 
-    if scheduler:
-        scheduler = Scheduler.from_dict(scheduler)
-    else:
-        scheduler = Scheduler()
-
     rating_obj = rating_map[rating]
     new_card, review_log = scheduler.review_card(card, rating_obj)
 
     return new_card.to_dict(), review_log.to_dict()
 
 
+def schedule_flashcards_fsrs(reviews, scheduler):
+    # Repeated reviews of the same card continue from its latest state
+    cards = {}
+    results = []
+    for review in reviews:
+        card_id = review.get("card_id")
+        if card_id is not None and card_id in cards:
+            card = cards[card_id]
+        elif review.get("card"):
+            card = Card.from_dict(review.get("card"))
+        else:
+            card = Card()
+
+        review_datetime = review.get("review_datetime")
+        if review_datetime:
+            review_datetime = review_datetime.astimezone(timezone.utc)
+
+        new_card, review_log = scheduler.review_card(
+            card,
+            rating_map[review.get("rating")],
+            review_datetime=review_datetime
+        )
+        if card_id is not None:
+            cards[card_id] = new_card
+        results.append((new_card.to_dict(), review_log.to_dict()))
+
+    return results
+
+
 def get_ratings_times(card, scheduler):
     timestamp = datetime.now(timezone.utc)
 
@@ -36,32 +65,20 @@ def get_ratings_times(card, scheduler):
     else:
         card = Card()
 
-    if scheduler:
-        scheduler = Scheduler.from_dict(scheduler)
-    else:
-        scheduler = Scheduler()
-
+    # review_card copies the card it is given and leaves the scheduler untouched,
+    # so every rating can be previewed from the same card state
     ratings_times = {}
     for r, val in rating_map.items():
-        temp_card = copy.deepcopy(card)
-        scheduler = copy.deepcopy(scheduler)
-
-        temp_card, _ = scheduler.review_card(temp_card, val)
+        temp_card, _ = scheduler.review_card(card, val, review_datetime=timestamp)
         ratings_times[r] = max(0, int((temp_card.due - timestamp).total_seconds()))
 
     return ratings_times
 
-# celery task
-def optimize_scheduler(scheduler, user_id):
-    new_scheduler = None
-
-    # Check if there are enough review logs
-    # ...
-
-    # Get review logs
-    # ...
-
-    # Optimize the scheduler
-    # ...
+def optimize_scheduler(scheduler, review_logs):
+    # Fit the FSRS weights to the user's review history, keeping the other settings
+    optimizer = Optimizer(review_logs)
+    parameters = optimizer.compute_optimal_parameters()
 
-    return new_scheduler
\ No newline at end of file
+    scheduler_dict = scheduler.to_dict()
+    scheduler_dict["parameters"] = list(parameters)
+    return Scheduler.from_dict(scheduler_dict)
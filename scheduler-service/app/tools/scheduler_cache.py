@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+import os
+
+
+SCHEDULER_CACHE_SIZE = int(os.getenv("SCHEDULER_CACHE_SIZE", 1024))
+SCHEDULER_CACHE_TTL = float(os.getenv("SCHEDULER_CACHE_TTL", 300))
+
+
+class SchedulerCache:
+    def __init__(self, max_size=SCHEDULER_CACHE_SIZE, ttl=SCHEDULER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # user_id -> (expires_at, scheduler)
+        self._lock = Lock()
+
+    def get(self, user_id, loader):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        scheduler = loader(user_id)
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, scheduler)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return scheduler
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            requests_num = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests_num if requests_num else 0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl
+            }
+
+
+scheduler_cache = SchedulerCache()
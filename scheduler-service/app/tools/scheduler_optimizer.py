@@ -0,0 +1,115 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import multiprocessing
+import traceback
+import zlib
+import os
+
+from fsrs import ReviewLog
+
+from .. import db, content_client, scheduler_client
+from .flashcard_scheduler import load_scheduler, optimize_scheduler
+
+
+OPTIMIZER_MIN_REVIEWS = int(os.getenv("OPTIMIZER_MIN_REVIEWS", 400))
+OPTIMIZER_CHUNK_SIZE = int(os.getenv("OPTIMIZER_CHUNK_SIZE", 5000))
+OPTIMIZER_PROCESSES = int(os.getenv("OPTIMIZER_PROCESSES", os.cpu_count() or 1))
+OPTIMIZER_MAX_REVIEWS = int(os.getenv("OPTIMIZER_MAX_REVIEWS", 50000))
+
+
+def is_card_sampled(card_id, fraction):
+    # Stable per card, so a sampled card keeps its whole review history
+    return zlib.crc32(str(card_id).encode()) < fraction * 2**32
+
+
+def stream_review_logs(user_id, fraction=1.0, chunk_size=OPTIMIZER_CHUNK_SIZE):
+    after_id = 0
+    while True:
+        response = content_client.get_sync(
+            "/review-logs",
+            params={"user_id": user_id, "after_id": after_id, "limit": chunk_size}
+        )
+        response.raise_for_status()
+        response_data = response.json()
+        review_logs = response_data.get("review_logs")
+        if not review_logs:
+            return
+        yield [
+            ReviewLog.from_dict(review_log) for review_log in review_logs
+            if fraction >= 1 or is_card_sampled(review_log["card_id"], fraction)
+        ]
+        if len(review_logs) < chunk_size:
+            return
+        after_id = response_data.get("last_id")
+
+
+def get_users_to_optimize():
+    """Users with enough reviews and new ones since their last fit."""
+    response = content_client.get_sync("/review-logs-summary")
+    response.raise_for_status()
+
+    optimizer_runs = {
+        run["user_id"]: run.get("last_review_id", 0)
+        for run in db["optimizer_runs_collection"].find({}, {"user_id": 1, "last_review_id": 1})
+    }
+    return [
+        user for user in response.json().get("users")
+        if user["review_count"] >= OPTIMIZER_MIN_REVIEWS
+        and user["last_review_id"] > optimizer_runs.get(user["user_id"], 0)
+    ]
+
+
+def optimize_user_scheduler(user):
+    user_id = user["user_id"]
+    try:
+        # The optimizer needs every log at once, so large histories are cut down to a sample of cards
+        fraction = min(1.0, OPTIMIZER_MAX_REVIEWS / max(user["review_count"], 1))
+        review_logs = [
+            review_log
+            for chunk in stream_review_logs(user_id, fraction)
+            for review_log in chunk
+        ]
+
+        schedulers_collection = db["schedulers_collection"]
+        scheduler = schedulers_collection.find_one({"user_id": user_id}, {"_id": 0})
+        new_scheduler = optimize_scheduler(load_scheduler(scheduler), review_logs)
+
+        schedulers_collection.replace_one(
+            {"user_id": user_id},
+            {"user_id": user_id, **new_scheduler.to_dict()},
+            upsert=True
+        )
+        db["optimizer_runs_collection"].replace_one(
+            {"user_id": user_id},
+            {
+                "user_id": user_id,
+                "last_review_id": user["last_review_id"],
+                "review_count": user["review_count"],
+                "sampled_review_count": len(review_logs),
+                "optimized_at": datetime.now(timezone.utc)
+            },
+            upsert=True
+        )
+
+        # Drop the stale scheduler cached by the API process
+        scheduler_client.post_sync(
+            "/invalidate-scheduler",
+            json={"user_id": user_id}
+        ).raise_for_status()
+        return {"user_id": user_id, "optimized": True}
+    except Exception as e:
+        traceback.print_exc()
+        return {"user_id": user_id, "optimized": False, "err": str(e)}
+
+
+def optimize_schedulers(processes=OPTIMIZER_PROCESSES):
+    users = get_users_to_optimize()
+    if not users:
+        return []
+
+    # Spawned workers open their own Mongo connection instead of sharing a forked one
+    with ProcessPoolExecutor(
+        max_workers=min(processes, len(users)),
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return list(executor.map(optimize_user_scheduler, users))
@@ -0,0 +1,18 @@
+import time
+import os
+
+from app.tools.scheduler_optimizer import optimize_schedulers
+
+
+OPTIMIZER_INTERVAL = int(os.getenv("OPTIMIZER_INTERVAL", 3600))
+
+# Refits the FSRS parameters of users with new reviews since their last fit
+# python optimizer_worker.py
+if __name__ == "__main__":
+    while True:
+        try:
+            results = optimize_schedulers()
+            print("Optimized schedulers:", results)
+        except Exception as e:
+            print("Error in optimizer worker:", str(e))
+        time.sleep(OPTIMIZER_INTERVAL)
@@ -2,6 +2,8 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from types import SimpleNamespace
 from datetime import datetime
 import uuid
@@ -10,18 +12,19 @@ import uuid
 # directly from run.py (so you don't import app.dependencies).
 from run import app  
 from app.models import Base, Folder
-from app.database import get_db, SQLALCHEMY_DATABASE_URL
+from app.database import get_db, SQLALCHEMY_DATABASE_URL, ASYNC_SQLALCHEMY_DATABASE_URL
 
 # ─── Database setup ───────────────────────────────────────────────────────────
+# Sync engine for the schema and seeding, async one for the handlers
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# TestClient may run each request on a new event loop, so connections are not pooled
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
+async def override_get_db():
+    async with AsyncTestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
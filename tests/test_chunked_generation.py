@@ -0,0 +1,85 @@
+import sys
+import os
+
+# Import the merge helpers from the file processor's app package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../file-processor-service'))
+os.environ.setdefault("REDIS_HOST", "localhost:6379")
+from app.tools.chunked_generation import dedupe, merge_flashcards, merge_tests, merge_notes, share_amount
+
+
+def basic(front):
+    return {"front": front, "back": "answer"}
+
+def cloze(text):
+    return {"text": text}
+
+def list_card(question):
+    return {"question": question, "answer": ["a", "b"]}
+
+
+def test_dedupe_normalizes_keys():
+    items = [basic("What is ATP?"), basic("  what is   atp? "), basic("What is DNA?")]
+    assert dedupe(items, "front") == [items[0], items[2]]
+
+def test_dedupe_drops_malformed_items():
+    items = ["not a card", {"back": "no front"}, {"front": ""}, basic("Kept")]
+    assert dedupe(items, "front") == [basic("Kept")]
+
+def test_merge_flashcards_without_amount_keeps_all():
+    partial_decks = [
+        {"deck_name": "Biology", "basic_flashcards": [basic("Q1"), basic("Q2")]},
+        {"deck_name": "Biology 2", "basic_flashcards": [basic("q1"), basic("Q3")], "cloze_flashcards": [cloze("C1")]},
+    ]
+    flashcards = merge_flashcards(partial_decks)
+    assert flashcards["deck_name"] == "Biology"
+    assert [card["front"] for card in flashcards["basic_flashcards"]] == ["Q1", "Q2", "Q3"]
+    assert flashcards["cloze_flashcards"] == [cloze("C1")]
+    assert "list_flashcards" not in flashcards
+
+def test_merge_flashcards_trims_across_types():
+    partial_decks = [
+        {
+            "deck_name": "Deck",
+            "basic_flashcards": [basic(f"B{i}") for i in range(10)],
+            "cloze_flashcards": [cloze(f"C{i}") for i in range(10)],
+            "list_flashcards": [list_card(f"L{i}") for i in range(10)],
+        }
+    ]
+    flashcards = merge_flashcards(partial_decks, amount=9)
+    # Basic cards alone could fill the amount, but every type keeps its part
+    assert len(flashcards["basic_flashcards"]) == 3
+    assert len(flashcards["cloze_flashcards"]) == 3
+    assert len(flashcards["list_flashcards"]) == 3
+
+def test_merge_flashcards_hands_on_unused_share():
+    partial_decks = [
+        {
+            "deck_name": "Deck",
+            "basic_flashcards": [basic(f"B{i}") for i in range(20)],
+            "cloze_flashcards": [cloze("C0")],
+        }
+    ]
+    flashcards = merge_flashcards(partial_decks, amount=10)
+    assert len(flashcards["cloze_flashcards"]) == 1
+    assert len(flashcards["basic_flashcards"]) == 9
+
+def test_share_amount_never_exceeds_counts():
+    assert share_amount({"a": 2, "b": 0, "c": 1}, 10) == {"a": 2, "b": 0, "c": 1}
+    assert sum(share_amount({"a": 7, "b": 5, "c": 9}, 11).values()) == 11
+
+def test_merge_tests_dedupes_questions():
+    partial_tests = [
+        {"test_name": "Quiz", "multiple_choice_test_items": [{"question": "Q1"}, {"question": "Q2"}]},
+        {"test_name": "Quiz 2", "multiple_choice_test_items": [{"question": "q1"}, {"question": "Q3"}]},
+    ]
+    test = merge_tests(partial_tests)
+    assert test["test_name"] == "Quiz"
+    assert [item["question"] for item in test["multiple_choice_test_items"]] == ["Q1", "Q2", "Q3"]
+
+def test_merge_notes_joins_sections_in_order():
+    partial_notes = [
+        {"note_name": "Notes", "note_content": "<p>One</p>"},
+        {"note_name": "Other", "note_content": ""},
+        {"note_name": "Other", "note_content": "<p>Two</p>"},
+    ]
+    assert merge_notes(partial_notes) == {"note_name": "Notes", "note_content": "<p>One</p><hr/><p>Two</p>"}
@@ -0,0 +1,49 @@
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Import the generator module from the file processor's app package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../file-processor-service'))
+os.environ.setdefault("REDIS_HOST", "localhost:6379")
+from app.apis import study_units_generator
+from app import celery_app
+
+
+@pytest.fixture(autouse=True)
+def eager_celery():
+    celery_app.conf.task_always_eager = True
+    yield
+    celery_app.conf.task_always_eager = False
+
+
+def test_extraction_error_returns_no_text_ref():
+    with patch.object(study_units_generator, "extract_files_text", side_effect=RuntimeError("bad file")):
+        text_ref = study_units_generator.extract_text_task.run(
+            file_metadata=[{"file_id": "missing", "extension": "docx"}]
+        )
+    assert text_ref is None
+
+
+def test_generation_fails_after_extraction_error():
+    with patch.object(study_units_generator, "extract_files_text", side_effect=RuntimeError("bad file")), \
+         patch.object(study_units_generator.ai_factory, "get_ai") as get_ai:
+        text_ref = study_units_generator.extract_text_task.apply(
+            kwargs={"file_metadata": [{"file_id": "missing", "extension": "docx"}]}
+        ).get()
+        result = study_units_generator.generate_note_task.apply(
+            args=(text_ref,),
+            kwargs={"ai_model": None, "folder_id": "folder", "user_id": "user"}
+        )
+    # The status endpoints see a finished, failed task instead of one pending forever
+    assert result.failed()
+    assert "Could not extract text!" in str(result.result)
+    get_ai.return_value.get_ai_res.assert_not_called()
+
+
+def test_link_extraction_error_fails_generation():
+    with patch.object(study_units_generator, "extract_link_main_content", side_effect=TimeoutError("timed out")):
+        text_ref = study_units_generator.extract_text_task.run(link="http://example.com")
+    with patch.object(study_units_generator.ai_factory, "get_ai"), \
+         pytest.raises(ValueError, match="Could not extract text!"):
+        study_units_generator.generate_test_task.run(text_ref, ai_model=None, folder_id="folder", user_id="user")
@@ -39,7 +39,8 @@ export default function FlashcardsMainReview(props) {
         const flashcardDeck = await getFlashcards(getFlashcardsReqParams);
         if (flashcardDeck) {
             setInitialTotal(flashcardDeck.total_flashcards);
-            const firstFlashcardRatingsTimes = await getRatingsTimes(flashcardDeck.flashcards[0].fsrs_card);
+            const firstFlashcardRatingsTimes = flashcardDeck.flashcards[0].ratings_times
+                ?? await getRatingsTimes(flashcardDeck.flashcards[0].fsrs_card);
             setRatingsTimes(firstFlashcardRatingsTimes);
             setFlashcardDeck(flashcardDeck);
         }
@@ -48,8 +49,9 @@ export default function FlashcardsMainReview(props) {
     const clickShowAnswer = async () => {
         setAnswerDisplay(!answerDisplay());
 
-        // Get ratings times for the next flashcard
-        const resRatingsTimes = await getRatingsTimes(flashcardDeck().flashcards[0].fsrs_card);
+        // Get ratings times for the next flashcard, unless they came with the card
+        const resRatingsTimes = flashcardDeck().flashcards[0].ratings_times
+            ?? await getRatingsTimes(flashcardDeck().flashcards[0].fsrs_card);
         if (resRatingsTimes) setRatingsTimes(resRatingsTimes);
     };
 
@@ -130,7 +132,8 @@ export default function FlashcardsMainReview(props) {
         flashcards[0] = {
             ...flashcards[0],
             next_review: resData.due_date,
-            fsrs_card: resData.new_fsrs_card
+            fsrs_card: resData.new_fsrs_card,
+            ratings_times: resData.ratings_times
         };
 
         const lastFlashcard = flashcards[flashcards.length - 1];
@@ -28,33 +28,13 @@ const getFolders = async (folderId) => {
     return data;
 };
 
-const getFlashcardsStats = async (folderId) => {
-    const response = await apiRequest({
-        endpoint: `/api/content/flashcards-stats?folder_id=${folderId}`,
-    });
-    const data = await response.json();
-    if (!response.ok) return undefined;  
-    console.log("getFlashcardsStats", data)
-    return data;
-};
-
-const getNotesStats = async (folderId) => {
-    const response = await apiRequest({
-        endpoint: `/api/content/notes-stats?folder_id=${folderId}`,
-    });
-    const data = await response.json();
-    if (!response.ok) return undefined;    
-    console.log("getNotesStats", data)
-    return data;
-};
-
-const getTestsStats = async (folderId) => {
+const getFolderStats = async (folderId) => {
     const res = await apiRequest({
-        endpoint: `/api/content/test-items-stats?folder_id=${folderId}`,
+        endpoint: `/api/content/folder-stats?folder_id=${folderId}`,
     });
     if (!res.ok) return undefined;
     const data = await res.json();
-    console.log("getTestsStats", data)
+    console.log("getFolderStats", data)
     return data;
 };
 
@@ -64,18 +44,13 @@ export default function Home() {
         () => params.id,
         getFolders
     );
-    const [flashcardsStats, {refetch: refetchFlashcardsStats}] = createResource(
-        () => params.id,
-        getFlashcardsStats
-    );
-    const [notesItemsStats] = createResource(
-        () => params.id,
-        getNotesStats
-    );
-    const [testItemsStats] = createResource(
+    const [folderStats, {refetch: refetchFlashcardsStats}] = createResource(
         () => params.id,
-        getTestsStats
+        getFolderStats
     );
+    const flashcardsStats = () => folderStats()?.flashcards;
+    const notesItemsStats = () => folderStats()?.notes;
+    const testItemsStats = () => folderStats()?.test_items;
     const [flashcardsReview, setFlashcardsReview] = createSignal(false);
     const [testMixedReview, setTestMixedReview] = createSignal(false);
 
@@ -260,7 +235,7 @@ export default function Home() {
                 <Show when={flashcardsStats() || notesItemsStats() || testItemsStats()}>
                     <hr class="border-tertiary-10"/>
                     <div class="flex justify-between items-center w-full gap-4">
-                        <Show when={!flashcardsStats.loading}>
+                        <Show when={flashcardsStats()}>
                             <div class="flex flex-col justify-center items-center flex-1 min-w-0">
                                 <span class="mb-1">Flashcards</span>
                                 <div class="flex justify-center items-center w-full max-h-35">
@@ -272,7 +247,7 @@ export default function Home() {
                             </div>
                         </Show>
 
-                        <Show when={!testItemsStats.loading}>
+                        <Show when={testItemsStats()}>
                             <div class="flex flex-col justify-center items-center flex-1 min-w-0">
                                 <span class="mb-1">Test items</span>
                                 <div class="flex justify-center items-center w-full max-h-35"> 
@@ -286,7 +261,7 @@ export default function Home() {
                             </div>
                         </Show>
 
-                        <Show when={!notesItemsStats.loading}>
+                        <Show when={notesItemsStats()}>
                             <div class="flex flex-col justify-center items-center flex-1 min-w-0">
                                 <span class="mb-1">Notes</span>
                                 <div class="flex justify-center items-center w-full max-h-35"> 